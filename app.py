@@ -1,72 +1,75 @@
 import streamlit as st
 import pandas as pd
+import re
+import os
 import time
 from src.config import FILES
-from src.data_loader import load_dataset
+from src.data_loader import load_header
 from components.navigation import sidebar_menu
+from src.state import init_state, load_upload
 
 # --- 1. SESSION STATE SETUP ---
-def init_session_state():
-    if 'data_cache' not in st.session_state: st.session_state['data_cache'] = {}
-    if 'capability_map' not in st.session_state: st.session_state['capability_map'] = {}
-    if 'flags' not in st.session_state: 
-        st.session_state['flags'] = {'churn': False, 'segmentation': False, 'geo': False, 'sentiment': False}
-
-init_session_state()
+init_state()
 
 st.set_page_config(page_title="Customer Intelligence Hub", layout="wide")
 sidebar_menu()
 st.title("Customer Intelligence Hub")
 
+# --- CACHED LOADERS ---
+# Reruns hit Streamlit's in-memory cache instead of re-parsing the file
+# The mtime argument re-keys the header when the file changes on disk (as in state.load_file)
+@st.cache_data(show_spinner=False, max_entries=8)
+def _cached_header(path: str, mtime: float) -> pd.DataFrame:
+    return load_header(path)
+
+def _load_header(path: str) -> pd.DataFrame:
+    mtime = os.path.getmtime(path) if os.path.exists(path) else None
+    return _cached_header(path, mtime)
+
 # --- 2. THE FIX: LOOSE COLUMN MATCHING ---
-def auto_register_data(df, source_name):
+# Rule table built once at import: (module key, substring pattern, label), in detection order
+_DETECT_RULES = (
+    # Matches: 'ReviewBody', 'ReviewHeader', 'VerifiedReview'
+    ('sentiment', re.compile(r'review|text|comment|feedback|body|content|rating|star'), "Sentiment"),
+    # Matches: 'Route', 'Location', 'Airport'
+    ('geo', re.compile(r'lat|lon|city|country|airport|location|route|destination|origin'), "Geospatial"),
+    # Matches: 'ValueForMoney', 'SeatType', 'TotalCharges'
+    ('segmentation', re.compile(r'amount|sales|profit|quantity|total|spend|value|type|class'), "Segmentation"),
+    ('churn', re.compile(r'churn|exited|status|retention'), "Churn"),
+)
+
+# Display names, in detection order
+MODULE_LABELS = {key: label for key, _, label in _DETECT_RULES}
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def _detect(cols_key: tuple) -> tuple:
+    """
+    Pure function of the column names, so it is memoized on the
+    sorted, lowercased column set and survives reruns.
+    """
+    # One buffer for all columns: each search stops at the first hit
+    joined = "\x1f".join(cols_key)
+    return tuple(key for key, pattern, _ in _DETECT_RULES if pattern.search(joined))
+
+def auto_register_data(df, source_name, source_ref='MEMORY'):
     """
     Scans column names using SUBSTRING matching.
     If 'ReviewBody' exists, it sees 'review' and activates Sentiment.
+    With a FILES key as source_ref, only the reference is registered and
+    each module page loads the full file on demand.
     """
-    # Convert all columns to lowercase string for easy matching
-    cols = [str(c).lower() for c in df.columns]
-    detected = []
-
-    # Helper: Check if ANY keyword exists as a substring in ANY column
-    def scan_columns(keywords):
-        for col in cols:
-            for k in keywords:
-                if k in col: return True
-        return False
-
-    # A. SENTIMENT DETECTION
-    # Matches: 'ReviewBody', 'ReviewHeader', 'VerifiedReview'
-    if scan_columns(['review', 'text', 'comment', 'feedback', 'body', 'content', 'rating', 'star']):
-        st.session_state['data_cache']['sentiment'] = df
-        st.session_state['capability_map']['sentiment'] = 'MEMORY'
-        st.session_state['flags']['sentiment'] = True
-        detected.append("Sentiment")
+    modules = _detect(tuple(sorted(str(c).lower() for c in df.columns)))
 
-    # B. GEOSPATIAL DETECTION
-    # Matches: 'Route', 'Location', 'Airport'
-    if scan_columns(['lat', 'lon', 'city', 'country', 'airport', 'location', 'route', 'destination', 'origin']):
-        st.session_state['data_cache']['geo'] = df
-        st.session_state['capability_map']['geo'] = 'MEMORY'
-        st.session_state['flags']['geo'] = True
-        detected.append("Geospatial")
-
-    # C. SEGMENTATION DETECTION
-    # Matches: 'ValueForMoney', 'SeatType', 'TotalCharges'
-    if scan_columns(['amount', 'sales', 'profit', 'quantity', 'total', 'spend', 'value', 'type', 'class']):
-        st.session_state['data_cache']['segmentation'] = df
-        st.session_state['capability_map']['segmentation'] = 'MEMORY'
-        st.session_state['flags']['segmentation'] = True
-        detected.append("Segmentation")
-        
-    # D. CHURN DETECTION
-    if scan_columns(['churn', 'exited', 'status', 'retention']):
-        st.session_state['data_cache']['churn'] = df
-        st.session_state['capability_map']['churn'] = 'MEMORY'
-        st.session_state['flags']['churn'] = True
-        detected.append("Churn")
+    # Session-state writes stay outside the cached function
+    for key in modules:
+        if source_ref == 'MEMORY':
+            st.session_state['data_cache'][key] = df
+        else:
+            st.session_state['data_cache'].pop(key, None)
+        st.session_state['capability_map'][key] = source_ref
+        st.session_state['flags'][key] = True
 
-    return detected
+    return [MODULE_LABELS[k] for k in modules]
 
 # --- 3. INTERFACE ---
 st.markdown("---")
@@ -83,10 +86,11 @@ with col1:
         if st.button("Load Selected Dataset", type="primary"):
             with st.spinner(f"Loading '{selected_file_key}'..."):
                 try:
-                    df = load_dataset(FILES[selected_file_key])
+                    # Header only: the module pages load the full file lazily
+                    df = _load_header(FILES[selected_file_key])
                     
                     # Run the loose detection
-                    modules = auto_register_data(df, selected_file_key)
+                    modules = auto_register_data(df, selected_file_key, source_ref=selected_file_key)
                     
                     if modules:
                         st.success(f"Loaded! Active Modules: {', '.join(modules)}")
@@ -106,7 +110,7 @@ with col2:
     
     if uploaded_file:
         try:
-            df_upload = pd.read_csv(uploaded_file) if uploaded_file.name.endswith('.csv') else pd.read_excel(uploaded_file)
+            df_upload = load_upload(uploaded_file)
             
             # Run the loose detection
             modules = auto_register_data(df_upload, "Upload")
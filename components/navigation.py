@@ -1,8 +1,12 @@
 import streamlit as st
 import pandas as pd
 import os
-from src.data_loader import load_dataset
-from src.config import FILES
+from src.data_loader import load_header
+from src.state import load_upload
+from src.config import FILES, DATA_DIR
+
+# Exact column names that imply location
+GEO_KEYWORDS = frozenset({'city', 'country', 'latitude', 'longitude', 'lat', 'lon', 'location', 'region', 'airport'})
 
 def sidebar_menu():
     # --- 1. NAVIGATION LINKS ---
@@ -19,10 +23,6 @@ def sidebar_menu():
         # --- 2. DATA CONTROLS (Persistent) ---
         st.header(" Data Settings")
         
-        # Initialize Cache
-        if 'data_cache' not in st.session_state: st.session_state['data_cache'] = {}
-        if 'flags' not in st.session_state: st.session_state['flags'] = {}
-        
         mode = st.radio("Source:", ["Demo Data", "Upload File"], label_visibility="collapsed")
         
         # A. LOAD DEMO DATA
@@ -30,24 +30,18 @@ def sidebar_menu():
             st.info("Use pre-loaded datasets to test the capabilities.")
             if st.button("Load Sample Data", type="primary", use_container_width=True):
                 with st.spinner("Hydrating Engines..."):
+                    present = _demo_files_present()
                     
-                    # 1. Load Churn
-                    if os.path.exists(FILES['churn']):
-                        df = load_dataset(FILES['churn'])
-                        st.session_state['data_cache']['churn'] = df
-                        _check_geo_piggyback(df, 'churn')
-                    
-                    # 2. Load Segmentation
-                    if os.path.exists(FILES['segmentation']):
-                        df = load_dataset(FILES['segmentation'])
-                        st.session_state['data_cache']['segmentation'] = df
-                        _check_geo_piggyback(df, 'segmentation')
-                        
-                    # 3. Load Sentiment
-                    if os.path.exists(FILES['sentiment']):
-                        df = load_dataset(FILES['sentiment'])
-                        st.session_state['data_cache']['sentiment'] = df
-                        _check_geo_piggyback(df, 'sentiment')
+                    # Register file references only (header read for geo);
+                    # each module page loads its full file on demand.
+                    # Headers are parsed once per unique path.
+                    headers = {}
+                    for key in ('churn', 'segmentation', 'sentiment'):
+                        if key not in present: continue
+                        path = FILES[key]
+                        if path not in headers:
+                            headers[path] = load_header(path)
+                        _register_demo(key, headers[path])
                         
                 st.success("Demo Data Active!")
                 st.rerun()
@@ -57,25 +51,28 @@ def sidebar_menu():
             uploaded_file = st.file_uploader("Upload CSV", type=['csv'])
             if uploaded_file:
                 if st.button("Process File", use_container_width=True):
-                    df = load_dataset(uploaded_file)
+                    df = load_upload(uploaded_file)
                     if not df.empty:
                         # AUTO-ROUTING LOGIC
-                        cols = [c.lower() for c in df.columns]
+                        cols = {str(c).lower() for c in df.columns}
                         
                         routed = []
                         # Is it Churn?
                         if 'churn' in cols or 'tenure' in cols:
                             st.session_state['data_cache']['churn'] = df
+                            st.session_state['capability_map']['churn'] = 'MEMORY'
                             routed.append("Churn")
                         
                         # Is it Sentiment?
-                        if any(x in cols for x in ['review', 'comment', 'text', 'feedback']):
+                        if cols & {'review', 'comment', 'text', 'feedback'}:
                             st.session_state['data_cache']['sentiment'] = df
+                            st.session_state['capability_map']['sentiment'] = 'MEMORY'
                             routed.append("Sentiment")
                             
                         # Is it Segmentation? (Fallback if numeric)
                         if len(df.select_dtypes(include=['number']).columns) > 3:
                             st.session_state['data_cache']['segmentation'] = df
+                            st.session_state['capability_map']['segmentation'] = 'MEMORY'
                             routed.append("Segmentation")
                         
                         # Check Geo on EVERYTHING
@@ -88,7 +85,7 @@ def sidebar_menu():
         # --- 3. STATUS INDICATORS ---
         st.markdown("---")
         st.caption("System Status")
-        cache = st.session_state['data_cache']
+        cache = {**st.session_state['capability_map'], **st.session_state['data_cache']}
         
         c1, c2 = st.columns(2)
         c1.metric("Churn", "OK" if 'churn' in cache else "OFF")
@@ -98,17 +95,44 @@ def sidebar_menu():
         c3.metric("NLP", "OK" if 'sentiment' in cache else "OFF")
         c4.metric("Geo", "OK" if 'geo' in cache else "OFF")
 
-def _check_geo_piggyback(df, source_name):
+def _demo_files_present():
+    """
+    Helper: One directory listing instead of a stat per demo file.
+    Memoized for the session, since demo files don't change mid-session.
+    """
+    if '_demo_files_exist' not in st.session_state:
+        try:
+            with os.scandir(DATA_DIR) as entries:
+                names = {e.name for e in entries}
+        except FileNotFoundError:
+            names = set()
+        st.session_state['_demo_files_exist'] = {k for k, p in FILES.items() if os.path.basename(p) in names}
+    return st.session_state['_demo_files_exist']
+
+def _register_demo(key, header):
+    """
+    Helper: Registers a demo FILES entry by reference (no full parse).
+    """
+    st.session_state['data_cache'].pop(key, None)
+    st.session_state['capability_map'][key] = key
+    st.session_state['flags'][key] = True
+    
+    if _check_geo_piggyback(header, key, store=False):
+        st.session_state['data_cache'].pop('geo', None)
+        st.session_state['capability_map']['geo'] = key
+        st.session_state['flags']['geo'] = True
+
+def _check_geo_piggyback(df, source_name, store=True):
     """
     Helper: Checks any loaded dataframe for geospatial columns.
     If found, registers it as the Geo dataset.
     """
-    cols = [c.lower() for c in df.columns]
-    # Keywords that imply location
-    geo_keywords = ['city', 'country', 'latitude', 'longitude', 'lat', 'lon', 'location', 'region', 'airport']
+    cols = {str(c).lower() for c in df.columns}
     
-    if any(k in cols for k in geo_keywords):
-        st.session_state['data_cache']['geo'] = df
+    if GEO_KEYWORDS & cols:
+        if store:
+            st.session_state['data_cache']['geo'] = df
+            st.session_state['capability_map']['geo'] = 'MEMORY'
         st.session_state['flags']['geo_source'] = source_name
         return True
     return False
\ No newline at end of file
@@ -3,59 +3,53 @@ import pandas as pd
 import plotly.express as px
 import matplotlib.pyplot as plt
 import shap
-import os
+import io
 
 # --- IMPORTS ---
 from components.navigation import sidebar_menu
-from src.churn_engine import ChurnPredictor
+from src.state import init_state, load_file, column_schema, data_fingerprint
+from src.churn_engine import IMPORTANCE_SAMPLE
+from src.engines import get_churn_engine, CHURN_ENGINE_VERSION
 from src.recommendation_engine import generate_business_logic
-from src.data_loader import load_dataset
 from src.config import FILES
 
+# Candidate revenue columns for "Revenue at Risk" (matched case-insensitively)
+MRR_CANDIDATES = frozenset({'monthlycharges', 'amount', 'totalamount', 'sales'})
+
 # --- SETUP ---
 st.set_page_config(page_title="Churn AI", layout="wide")
+init_state()
 sidebar_menu()
 
 # --- 1. SELF-HEALING & RESET LOGIC (The Fix) ---
-# This block forces a reload if the engine is "Stale" (missing the new function)
-if 'churn_engine' in st.session_state:
-    engine = st.session_state['churn_engine']
-    # Check if this object is the "Old Version" (missing the fix)
-    if not hasattr(engine, 'get_shap_data'):
-        del st.session_state['churn_engine']
-        st.session_state['churn_engine'] = ChurnPredictor()
-        st.rerun() # Refresh page immediately
-
-# Initialize if missing
-if 'churn_engine' not in st.session_state:
-    st.session_state['churn_engine'] = ChurnPredictor()
-
-churn_bot = st.session_state['churn_engine']
+# One shared engine for all pages and sessions (see src/engines.py)
+churn_bot = get_churn_engine(CHURN_ENGINE_VERSION)
 
-# --- SIDEBAR: MANUAL RETRAIN OPTION ---
-with st.sidebar:
-    st.markdown("---")
-    st.header(" Model Controls")
-    if st.button(" Reset & Retrain Model", type="primary"):
-        # Clear model from memory
-        st.session_state['churn_engine'] = ChurnPredictor()
-        # Optional: Delete physical files to force fresh training
-        if os.path.exists("models/churn_model.pkl"):
-            os.remove("models/churn_model.pkl")
-        st.rerun()
+# --- CACHED SHAP (Simulator) ---
+# TreeExplainer output is deterministic per input row: key on the row values
+# and keep only the rendered PNG, so no matplotlib figure outlives the call
+@st.cache_data(max_entries=64, show_spinner=False)
+def _waterfall_png(_bot, model_version: int, row_key: tuple, _row: pd.Series):
+    # One-row frame only on a cache miss; infer_objects restores the numeric columns
+    shap_values = _bot.get_shap_data(_row.to_frame().T.infer_objects())
+    if shap_values is None:
+        return None
+    fig = plt.figure(figsize=(10, 4))
+    shap.plots.waterfall(shap_values, show=False, max_display=10)
+    buf = io.BytesIO()
+    fig.savefig(buf, format='png', bbox_inches='tight')
+    plt.close(fig)
+    return buf.getvalue()
 
 # --- 2. DATA LOADING ---
 def get_churn_data():
-    if 'capability_map' not in st.session_state: return pd.DataFrame()
     source_ref = st.session_state['capability_map'].get('churn')
     
     if source_ref == 'MEMORY':
         return st.session_state['data_cache'].get('churn', pd.DataFrame())
     elif source_ref in FILES:
-        return load_dataset(FILES[source_ref])
-    elif 'churn' in st.session_state.get('data_cache', {}):
-        return st.session_state['data_cache']['churn']
-    return pd.DataFrame()
+        return load_file(FILES[source_ref])
+    return st.session_state['data_cache'].get('churn', pd.DataFrame())
 
 df = get_churn_data()
 st.title(" Churn Prediction Engine")
@@ -65,6 +59,29 @@ if df.empty:
     st.info("Please go to the **Home** page and click ' Load Demo Data' or Upload a file.")
     st.stop()
 
+# --- SIDEBAR: MANUAL RETRAIN OPTION ---
+# The model is shared by every session: retrain on this data and swap it in only once
+# training succeeds, so nobody is left without a model in the meantime
+with st.sidebar:
+    st.markdown("---")
+    st.header(" Model Controls")
+    if churn_bot.model is not None:
+        confirm = st.checkbox("Replace the model for all users", key="churn_retrain_confirm")
+        if st.button(" Retrain Shared Model", type="primary", disabled=not confirm):
+            with st.spinner("Training XGBoost Model..."):
+                metrics = churn_bot.train(df)
+            if "error" in metrics:
+                st.error(metrics['error'])
+            else:
+                del st.session_state["churn_retrain_confirm"]
+                st.rerun()
+
+# Content hash of the loaded data, keys the per-data caches below
+data_key = data_fingerprint(df)
+
+# Column buckets by dtype, recomputed only when the schema changes
+dtypes = column_schema(df)
+
 # --- 3. TRAINING INTERFACE ---
 # If model is not trained (or was just reset), show this button
 if churn_bot.model is None:
@@ -88,8 +105,12 @@ tab_dashboard, tab_simulator = st.tabs([" Risk Dashboard", " What-If Simulator"]
 
 # === TAB 1: MACRO DASHBOARD ===
 with tab_dashboard:
-    if 'churn_scored' not in st.session_state:
+    # Re-score only when the model or the data content changes
+    score_key = (churn_bot.model_version, data_key)
+    if st.session_state.get('churn_scored_key') != score_key:
         st.session_state['churn_scored'] = churn_bot.predict(df)
+        st.session_state['churn_importance'] = churn_bot.get_directional_importance(df)
+        st.session_state['churn_scored_key'] = score_key
     scored_df = st.session_state['churn_scored']
 
     # A. KPI ROW
@@ -99,7 +120,8 @@ with tab_dashboard:
     high_risk_pct = high_risk_count / len(scored_df)
     
     # Try to find revenue column for "Revenue at Risk"
-    mrr_col = next((c for c in scored_df.columns if c.lower() in ['monthlycharges', 'amount', 'totalamount', 'sales']), None)
+    matches = scored_df.columns[scored_df.columns.astype(str).str.lower().isin(MRR_CANDIDATES)]
+    mrr_col = matches[0] if len(matches) else None
     
     k1.metric("Avg Churn Probability", f"{avg_risk:.1%}")
     k3.metric("High Risk Customers", high_risk_count, delta=f"{high_risk_pct:.1%} of Base", delta_color="inverse")
@@ -120,12 +142,14 @@ with tab_dashboard:
     
     with c2:
         st.subheader("Top Risk Drivers")
-        imp_df = churn_bot.get_directional_importance(scored_df)
+        imp_df = st.session_state['churn_importance']
         if not imp_df.empty:
             fig_bar = px.bar(imp_df, x='Importance', y='Feature', color='Impact',
                              color_discrete_map={"Increases Risk 🔴": '#e74c3c', "Decreases Risk 🟢": '#2ecc71', "Key Risk Driver ⚠️": 'gray'},
                              orientation='h')
             st.plotly_chart(fig_bar, use_container_width=True)
+            if len(df) > IMPORTANCE_SAMPLE:
+                st.caption(f"Risk direction estimated on a {IMPORTANCE_SAMPLE:,}-customer sample.")
 
     # C. AUTOMATED STRATEGIES
     st.markdown("---")
@@ -133,7 +157,7 @@ with tab_dashboard:
     col_rec, _ = st.columns([3, 1])
     
     with col_rec:
-        cat_cols = df.select_dtypes(include=['object']).columns.tolist()
+        cat_cols = dtypes['obj']
         cat_cols = [c for c in cat_cols if c not in ['customerID', 'Churn', 'Risk Group', 'churn']]
         
         # Default selections
@@ -141,7 +165,16 @@ with tab_dashboard:
         selected_vars = st.multiselect("Analyze Retention Drivers:", cat_cols, default=default_vars)
         
         if selected_vars:
-            recommendations = churn_bot.recommend_retention_plan(df, target_cols=selected_vars)
+            # Per-column results only depend on the data: compute each column once
+            if st.session_state.get('_churn_recs_key') != data_key:
+                st.session_state['_churn_recs'] = {}
+                st.session_state['_churn_recs_key'] = data_key
+            rec_cache = st.session_state['_churn_recs']
+            missing = [c for c in selected_vars if c not in rec_cache]
+            if missing:
+                found = churn_bot.recommend_retention_plan(df, target_cols=missing)
+                rec_cache.update({c: found.get(c) for c in missing})
+            recommendations = {c: rec_cache[c] for c in selected_vars if rec_cache[c]}
             if recommendations:
                 rec_cols = st.columns(len(recommendations))
                 for i, (feature, details) in enumerate(recommendations.items()):
@@ -157,14 +190,18 @@ with tab_simulator:
     
     col_input, col_viz = st.columns([1, 2])
     
-    with col_input:
-        st.info("Adjust values to see how risk changes.")
-        # Get a baseline customer
-        base_row = churn_bot.get_average_customer(df)
+    # Inputs live in a form: edits are batched into one rerun on "Simulate"
+    with col_input, st.form("simulator"):
+        st.info("Adjust values, then press Simulate to see how risk changes.")
+        # Get a baseline customer (medians/modes only change with the data)
+        if st.session_state.get('_churn_base_key') != data_key:
+            st.session_state['_churn_base_row'] = churn_bot.get_average_customer(df)
+            st.session_state['_churn_base_key'] = data_key
+        base_row = st.session_state['_churn_base_row']
         adjustments = {}
         
         # 1. Sliders for Numbers
-        num_cols = df.select_dtypes(include=['number']).columns.tolist()
+        num_cols = dtypes['num']
         target_nums = [c for c in num_cols if c not in ['Churn', 'churn', 'customerID']]
         
         for col in target_nums[:3]: # Limit to top 3 for UI cleanliness
@@ -173,16 +210,27 @@ with tab_simulator:
              adjustments[col] = st.slider(f"{col}", 0.0, max_val, val)
         
         # 2. Dropdowns for Categories
-        cat_cols = df.select_dtypes(include=['object']).columns.tolist()
+        cat_cols = dtypes['obj']
         target_cats = [c for c in cat_cols if c not in ['customerID', 'Churn', 'churn']]
         
+        # Option lists (and value -> position maps) only change with the data
+        if st.session_state.get('_churn_options_key') != data_key:
+            st.session_state['_churn_options'] = {}
+            for col in target_cats[:4]:
+                options = df[col].unique().tolist()
+                st.session_state['_churn_options'][col] = (options, {v: i for i, v in enumerate(options)})
+            st.session_state['_churn_options_key'] = data_key
+        unique_map = st.session_state['_churn_options']
+        
         for col in target_cats[:4]: # Limit to top 4
-            options = df[col].unique().tolist()
+            options, positions = unique_map[col]
             curr = base_row.get(col, options[0])
             # Ensure index is valid
-            idx = options.index(curr) if curr in options else 0
+            idx = positions.get(curr, 0)
             adjustments[col] = st.selectbox(f"{col}", options, index=idx)
 
+        st.form_submit_button("Simulate", type="primary")
+
     with col_viz:
         # Run Simulation
         sim_result = churn_bot.simulate_churn(base_row, adjustments)
@@ -199,23 +247,19 @@ with tab_simulator:
             st.markdown("---")
             st.write("**Why this prediction? (SHAP Waterfall)**")
             
-            # Prepare data for SHAP
-            # We reconstruct the row as a DataFrame
-            sim_row_df = pd.DataFrame([base_row])
-            for k, v in adjustments.items():
-                sim_row_df[k] = v
-            
-            try:
-                shap_values = churn_bot.get_shap_data(sim_row_df)
-                if shap_values:
-                    fig, ax = plt.subplots(figsize=(10, 4))
-                    # Check if shap_values is the new object type or old list
-                    if hasattr(shap_values, "values"):
-                        shap.plots.waterfall(shap_values, show=False, max_display=10)
-                    else:
-                        # Fallback for older SHAP versions if necessary
-                        st.warning("SHAP visualization requires newer library version.")
-                        
-                    st.pyplot(fig)
-            except Exception as e:
-                st.warning(f"Could not generate SHAP chart: {e}")
\ No newline at end of file
+            # Rendered on demand only, so the widgets above stay responsive
+            slot = st.empty()
+            if st.button("Explain this prediction"):
+                # Prepare data for SHAP: the simulated row stays a Series
+                sim_row = base_row.copy()
+                for k, v in adjustments.items():
+                    sim_row[k] = v
+                
+                with slot.container():
+                    try:
+                        row_key = tuple(sim_row.items())
+                        png = _waterfall_png(churn_bot, churn_bot.model_version, row_key, sim_row)
+                        if png:
+                            st.image(png)
+                    except Exception as e:
+                        st.warning(f"Could not generate SHAP chart: {e}")
\ No newline at end of file
@@ -1,33 +1,41 @@
 import streamlit as st
 import pandas as pd
 import plotly.express as px
-import matplotlib.pyplot as plt
-from sklearn.tree import plot_tree
+from sklearn.tree import export_graphviz
 
 # --- IMPORTS ---
 from components.navigation import sidebar_menu
-from src.segment_engine import SegmentationEngine # <--- CHANGED: Import Class
+from src.state import init_state, load_file, data_fingerprint
+from src.engines import get_seg_engine, SEGMENT_ENGINE_VERSION
 from src.recommendation_engine import generate_business_logic
 from src.nlg_engine import NarrativeGenerator
-from src.data_loader import load_dataset
 from src.config import FILES
 
 st.set_page_config(page_title="Segmentation Deep Dive", layout="wide")
+init_state()
 sidebar_menu()
 
 # --- INITIALIZE ENGINE ---
-if 'seg_engine' not in st.session_state:
-    st.session_state['seg_engine'] = SegmentationEngine()
-seg_bot = st.session_state['seg_engine']
+# One shared engine for all pages and sessions (see src/engines.py)
+seg_bot = get_seg_engine(SEGMENT_ENGINE_VERSION)
+
+# --- CACHED SILHOUETTE SWEEP ---
+# O(n^2) per k: run once per data version, keyed on a content hash
+@st.cache_data(show_spinner=False, max_entries=16)
+def suggest_k(data_key: str, _sample_df: pd.DataFrame) -> pd.DataFrame:
+    return seg_bot.suggest_optimal_k(_sample_df)
+
+# --- CACHED CLUSTERING ---
+# KMeans + rule tree refit only when k or the data changes, not on tab switches
+@st.cache_data(show_spinner=False, max_entries=16)
+def run_segmentation(data_key: str, k: int, _df: pd.DataFrame) -> dict:
+    return seg_bot.run_segmentation_model(_df, k=k)
 
 # --- HELPER: ROBUST DATA LOADER ---
 def get_active_data(module_key):
     """
     Robustly retrieves data from Memory (Uploads) or Disk (Sample Paths).
     """
-    if 'capability_map' not in st.session_state: 
-        return pd.DataFrame()
-    
     source = st.session_state['capability_map'].get(module_key)
     
     # 1. Check Memory Cache
@@ -36,7 +44,7 @@ def get_active_data(module_key):
     
     # 2. Check Disk
     if source in FILES:
-        return load_dataset(FILES[source])
+        return load_file(FILES[source])
 
     # 3. Fallback
     return st.session_state.get('data_cache', {}).get(module_key, pd.DataFrame())
@@ -63,6 +71,9 @@ if df.empty:
     st.info("Please go to Home and Load/Upload data.")
     st.stop()
 
+# Content hash of the loaded data, keys the per-data caches below
+data_key = data_fingerprint(df)
+
 # 2. SIDEBAR TUNING
 with st.sidebar:
     st.header(" Hyperparameters")
@@ -70,10 +81,10 @@ with st.sidebar:
     if st.checkbox(" Suggest Optimal K?"):
         with st.spinner("Calculating Silhouette Scores..."):
             # Use a sample for speed if dataset is huge
-            sample_df = df.head(1000) if len(df) > 1000 else df
+            sample_df = df.head(500)
             
             # CALL CLASS METHOD
-            scores = seg_bot.suggest_optimal_k(sample_df)
+            scores = suggest_k(data_key, sample_df)
             
             if not scores.empty:
                 best_k = scores['score'].idxmax()
@@ -92,7 +103,7 @@ with st.sidebar:
 try:
     with st.spinner(f"Clustering customers into {k_clusters} groups..."):
         # CALL CLASS METHOD
-        result = seg_bot.run_segmentation_model(df, k=k_clusters)
+        result = run_segmentation(data_key, k_clusters, df)
         
         seg_df = result['data']
         dt_model = result['dt_model']
@@ -166,15 +177,14 @@ with tab_rules:
     class_names = [cluster_map.get(c, str(c)) for c in present_classes]
 
     if dt_model:
-        fig_tree, ax = plt.subplots(figsize=(25, 10))
-        plot_tree(dt_model, 
-                  feature_names=dt_features, 
-                  class_names=class_names, # Use mapped names
-                  filled=True, 
-                  rounded=True, 
-                  fontsize=10, 
-                  ax=ax)
-        st.pyplot(fig_tree)
+        # DOT source rendered as SVG in the browser (no matplotlib figure)
+        dot = export_graphviz(dt_model, 
+                              out_file=None,
+                              feature_names=dt_features, 
+                              class_names=class_names, # Use mapped names
+                              filled=True, 
+                              rounded=True)
+        st.graphviz_chart(dot, use_container_width=True)
     else:
         st.info("Decision Tree model not available.")
 
@@ -183,7 +193,7 @@ with tab_strategy:
     st.subheader(" Recommendation Engine")
     
     # Calculate summary stats for the recommendation engine
-    summary_stats = seg_df.groupby('Cluster_Label')[dt_features].mean().round(1)
+    summary_stats = seg_df.groupby('Cluster_Label', observed=True)[dt_features].mean().round(1)
     
     # Use existing recommendation logic
     # We pass the engine_mode (Demographic/RFM) to pick the right strategy
@@ -1,32 +1,65 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import plotly.express as px
 from components.navigation import sidebar_menu
-from src.sentiment_engine import SentimentAnalyzer
-from src.data_loader import load_dataset
+from src.state import init_state, load_file, column_schema, data_fingerprint
+from src.sentiment_engine import SENTIMENT_LABELS
+from src.engines import get_sentiment_engine, SENTIMENT_ENGINE_VERSION
 from src.config import FILES
 
 st.set_page_config(page_title="Sentiment AI", layout="wide")
+init_state()
 sidebar_menu()
 
+# --- ENGINE ---
+# VADER scoring is the slow pass: re-running the same data/column (e.g. after Reset) reuses it
+@st.cache_data(show_spinner=False, max_entries=8)
+def score_sentiment(data_key: str, text_col: str, _df: pd.DataFrame) -> pd.DataFrame:
+    return get_sentiment_engine(SENTIMENT_ENGINE_VERSION).analyze_sentiment(_df, text_col)
+
+# --- COLUMN DETECTION ---
+# Depends only on the column names, so it is memoized across reruns
+@st.cache_data(show_spinner=False, max_entries=32)
+def default_text_idx(text_cols: tuple) -> int:
+    """ First 'body'/'content'/'text' column (Body over Header), else 0. """
+    mask = pd.Index(text_cols).astype(str).str.lower().str.contains('body|content|text')
+    return int(mask.argmax()) if mask.any() else 0
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def col_nunique(df: pd.DataFrame) -> dict:
+    """ Per-column distinct counts, computed once per dataset version. """
+    return df.nunique().to_dict()
+
+def sentiment_counts(results: pd.DataFrame, group_col: str) -> pd.DataFrame:
+    """ (group, label) counts via one bincount over integer codes; same rows and order as groupby().size(). """
+    group_codes, groups = pd.factorize(results[group_col], sort=True)
+    label_codes = results['Sentiment_Label'].astype(pd.CategoricalDtype(SENTIMENT_LABELS)).cat.codes.to_numpy()
+    keep = (group_codes >= 0) & (label_codes >= 0)
+    n_labels = len(SENTIMENT_LABELS)
+    counts = np.bincount(group_codes[keep] * n_labels + label_codes[keep], minlength=len(groups) * n_labels)
+    observed = np.flatnonzero(counts)
+    return pd.DataFrame({
+        group_col: groups.take(observed // n_labels),
+        'Sentiment_Label': pd.Categorical.from_codes(observed % n_labels, SENTIMENT_LABELS),
+        'Count': counts[observed],
+    })
+
 # --- 1. RESET LOGIC (Sidebar) ---
 # This is crucial: It lets you "Retrain" if you picked the wrong column
 with st.sidebar:
     st.markdown("---")
     st.header(" Controls")
     if st.button(" Reset Analysis", type="secondary"):
-        if 'sentiment_results' in st.session_state:
-            del st.session_state['sentiment_results']
-        if 'topics' in st.session_state:
-            del st.session_state['topics']
+        for key in ('sentiment_results', 'topics', 'sentiment_shares', 'sentiment_groups', 'sentiment_nunique'):
+            st.session_state.pop(key, None)
         st.rerun()
 
 # --- 2. LOAD DATA ---
 def get_sentiment_data():
-    if 'capability_map' not in st.session_state: return pd.DataFrame()
     source = st.session_state['capability_map'].get('sentiment')
     if source == 'MEMORY': return st.session_state['data_cache'].get('sentiment', pd.DataFrame())
-    if source in FILES: return load_dataset(FILES[source])
+    if source in FILES: return load_file(FILES[source])
     return st.session_state.get('data_cache', {}).get('sentiment', pd.DataFrame())
 
 df = get_sentiment_data()
@@ -46,14 +79,10 @@ if 'sentiment_results' not in st.session_state:
     with col_text:
         # A. Text Column Selection
         # We allow you to choose ANY string column (Header vs Body)
-        text_candidates = df.select_dtypes(include=['object', 'string']).columns
+        text_candidates = column_schema(df)['text']
         
         # Smart Default: Try to find 'body' or 'review', else 'header'
-        default_idx = 0
-        for i, c in enumerate(text_candidates):
-            if any(x in c.lower() for x in ['body', 'content', 'text']): # Prioritize Body over Header
-                default_idx = i
-                break
+        default_idx = default_text_idx(tuple(text_candidates))
         
         text_col = st.selectbox("1. Select Review Column (Text):", text_candidates, index=default_idx)
         st.caption("Choose the column containing the actual feedback.")
@@ -62,7 +91,8 @@ if 'sentiment_results' not in st.session_state:
         # B. Classification Selection
         # Filter for Categorical columns (Low cardinality)
         # We pre-select one, but you can change it later in the dashboard
-        cat_candidates = [c for c in df.columns if df[c].nunique() < 50 and c != text_col]
+        nunique = col_nunique(df)
+        cat_candidates = [c for c in df.columns if nunique[c] < 50 and c != text_col]
         default_cat = cat_candidates[0] if cat_candidates else "None"
         st.write("2. Analysis Mode: Full Corpus + Topic Extraction")
         st.write(f"*(You can group by '{default_cat}' after analysis)*")
@@ -71,16 +101,21 @@ if 'sentiment_results' not in st.session_state:
     if st.button(" Run AI Analysis", type="primary"):
         with st.spinner(f"Analyzing '{text_col}'..."):
             try:
-                analyzer = SentimentAnalyzer()
+                analyzer = get_sentiment_engine(SENTIMENT_ENGINE_VERSION)
                 # 1. Sentiment Score
-                df_scored = analyzer.analyze_sentiment(df, text_col)
+                data_key = data_fingerprint(df)
+                df_scored = score_sentiment(data_key, text_col, df)
                 # 2. Topic Modeling
-                topics = analyzer.extract_topics(df_scored, 'Clean_Text', n_topics=5)
-                # 3. Topic Assignment
-                df_final = analyzer.get_topic_distribution(df_scored, 'Clean_Text')
+                topics, topic_model = analyzer.extract_topics(df_scored, 'Clean_Text', n_topics=5)
+                # 3. Topic Assignment (with this run's model: the engine is shared across sessions)
+                df_final = analyzer.get_topic_distribution(df_scored, topic_model, 'Clean_Text')
                 
                 st.session_state['sentiment_results'] = df_final
                 st.session_state['topics'] = topics
+                # Label shares and per-column breakdowns only change on re-analysis
+                st.session_state['sentiment_shares'] = df_final['Sentiment_Label'].value_counts(normalize=True)
+                st.session_state['sentiment_groups'] = {}
+                st.session_state['sentiment_nunique'] = df_final.nunique().to_dict()
                 st.rerun()
             except Exception as e:
                 st.error(f"Analysis Failed: {str(e)}")
@@ -93,8 +128,11 @@ else:
     
     # --- TOP METRICS ---
     k1, k2, k3, k4 = st.columns(4)
-    pos = (results['Sentiment_Label'] == 'Positive').mean()
-    neg = (results['Sentiment_Label'] == 'Negative').mean()
+    shares = st.session_state.get('sentiment_shares')
+    if shares is None:
+        shares = st.session_state['sentiment_shares'] = results['Sentiment_Label'].value_counts(normalize=True)
+    pos = shares.get('Positive', 0.0)
+    neg = shares.get('Negative', 0.0)
     k1.metric("😊 Positive", f"{pos:.1%}")
     k2.metric("😡 Negative", f"{neg:.1%}")
     k3.metric("Neutral", f"{(1-pos-neg):.1%}")
@@ -104,7 +142,10 @@ else:
     st.markdown("###  Classification Analysis")
     
     # Dynamic Grouping
-    slice_cols = [c for c in results.columns if results[c].nunique() < 50 and c not in ['Clean_Text', 'Sentiment_Label', 'Sentiment_Score', 'Topic_Label', 'Topic_ID']]
+    nunique = st.session_state.get('sentiment_nunique')
+    if nunique is None:
+        nunique = st.session_state['sentiment_nunique'] = results.nunique().to_dict()
+    slice_cols = [c for c in results.columns if nunique[c] < 50 and c not in ['Clean_Text', 'Sentiment_Label', 'Sentiment_Score', 'Topic_Label', 'Topic_ID']]
     
     if slice_cols:
         c_sel, c_chart = st.columns([1, 3])
@@ -114,7 +155,10 @@ else:
             
         with c_chart:
             # Stacked Bar Chart
-            df_grouped = results.groupby([group_col, 'Sentiment_Label']).size().reset_index(name='Count')
+            groups = st.session_state.setdefault('sentiment_groups', {})
+            if group_col not in groups:
+                groups[group_col] = sentiment_counts(results, group_col)
+            df_grouped = groups[group_col]
             fig = px.bar(df_grouped, x=group_col, y='Count', color='Sentiment_Label', 
                          title=f"Sentiment by {group_col}",
                          color_discrete_map={'Positive':'#2ecc71', 'Negative':'#e74c3c', 'Neutral':'#95a5a6'})
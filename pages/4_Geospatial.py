@@ -1,24 +1,22 @@
 import streamlit as st
 import pandas as pd
+import re
+import numpy as np
 import plotly.express as px
 from components.navigation import sidebar_menu
-from src.geo_engine import GeoAnalyzer
+from src.state import init_state, load_file, column_schema, data_fingerprint
+from src.engines import get_geo_engine, GEO_ENGINE_VERSION
 from src.recommendation_engine import generate_business_logic
-from src.data_loader import load_dataset
 from src.config import FILES
 
-# Clean state
-if 'geo_engine' in st.session_state and not hasattr(st.session_state['geo_engine'], 'analyze_location_data'):
-    del st.session_state['geo_engine']
-
 st.set_page_config(page_title="Geospatial Intelligence", layout="wide")
+init_state()
 sidebar_menu()
 
 def get_geo_data():
-    if 'capability_map' not in st.session_state: return pd.DataFrame()
     source = st.session_state['capability_map'].get('geo')
     if source == 'MEMORY': return st.session_state.get('data_cache', {}).get('geo', pd.DataFrame())
-    if source in FILES: return load_dataset(FILES[source])
+    if source in FILES: return load_file(FILES[source])
     return st.session_state.get('data_cache', {}).get('geo', pd.DataFrame())
 
 st.title(" Geospatial Intelligence")
@@ -28,14 +26,47 @@ if df.empty or not st.session_state.get('flags', {}).get('geo'):
     st.error(" No Geospatial Data Active.")
     st.stop()
 
-if 'geo_engine' not in st.session_state: st.session_state['geo_engine'] = GeoAnalyzer()
-geo_bot = st.session_state['geo_engine']
+geo_bot = get_geo_engine(GEO_ENGINE_VERSION)
+
+# --- COLUMN NAME PATTERNS ---
+# Compiled once: one case-insensitive scan per column name
+_LOC_RE = re.compile(r'location|route|city|country', re.I)
+_MONEY_RE = re.compile(r'total|amount|sales|charge', re.I)
+
+# --- CACHED GEOCODING ---
+# Keyed on a stable digest of the location column, so the disk copy is reused after a restart.
+# Fast mode only (no API calls); n_api_hits re-keys it once a Deep Scan has added coordinates
+GEO_COLS = ['lat', 'lon', 'Mapped_Location']
+
+@st.cache_data(show_spinner=False, persist="disk", max_entries=16)
+def geocode(loc_key: str, loc_col: str, n_api_hits: int, _locations: pd.DataFrame) -> pd.DataFrame:
+    out = geo_bot.analyze_location_data(_locations, loc_col)
+    out = out.reindex(columns=GEO_COLS)
+    # float32 coordinates: half the bytes through groupbys and the Plotly payload
+    out[['lat', 'lon']] = out[['lat', 'lon']].astype('float32')
+    return out
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def count_empty(loc_key: str, _col: pd.Series) -> int:
+    """ NaN plus blank / 'nan' strings (any case), matching what the geo engine treats as empty. """
+    text = _col.dropna().astype(str).str.strip().str.lower()
+    return int(_col.isna().sum() + text.isin(['', 'nan']).sum())
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def location_means(loc_df: pd.DataFrame, target: str) -> pd.Series:
+    """ Mean of one metric per location; cached per metric as users flip the selectbox. """
+    return loc_df.groupby('Mapped_Location', observed=True, sort=False)[target].mean()
+
+def with_coords(coords: pd.DataFrame) -> pd.DataFrame:
+    geo_df = df.copy()
+    geo_df[GEO_COLS] = coords
+    return geo_df
 
 # Find Location Column
 meta = st.session_state.get('meta', {}).get('geo', {})
 loc_col = meta.get('location_col', None)
 if not loc_col:
-    possible = [c for c in df.columns if any(k in c.lower() for k in ['location','route','city','country'])]
+    possible = [c for c in df.columns if _LOC_RE.search(c)]
     loc_col = possible[0] if possible else df.columns[0]
 
 st.info(f" Analyzing geography from: **{loc_col}**")
@@ -43,18 +74,16 @@ st.info(f" Analyzing geography from: **{loc_col}**")
 # Run Engine (Fast Mode)
 status_container = st.empty()
 def update_progress(pct, msg):
-    if 'deep_scan_active' in st.session_state: status_container.progress(pct, text=msg)
+    status_container.progress(pct, text=msg)
 
-if 'geo_processed_df' not in st.session_state:
-    with st.spinner(" Rapid Matching..."):
-        geo_df = geo_bot.analyze_location_data(df, loc_col, use_api=False)
-        st.session_state['geo_processed_df'] = geo_df
-else:
-    geo_df = st.session_state['geo_processed_df']
+loc_key = data_fingerprint(df[loc_col])
+# Location columns this session has Deep Scanned (the API only runs on that click)
+deep_scanned = st.session_state.setdefault('deep_scanned_keys', set())
+with st.spinner(" Rapid Matching..."):
+    geo_df = with_coords(geocode(loc_key, loc_col, len(geo_bot.api_hits), df[[loc_col]]))
 
 # --- METRICS & UNMATCHED LOGIC ---
-raw_col = df[loc_col].astype(str).replace('nan', '').str.strip()
-empty_count = (raw_col == '').sum()
+empty_count = count_empty(loc_key, df[loc_col])
 unmatched_geo = geo_df[geo_df['lat'].isna()]
 unmatched_count = len(unmatched_geo) - empty_count
 if unmatched_count < 0: unmatched_count = 0
@@ -73,12 +102,14 @@ if unmatched_count > 0:
         if not bad_rows.empty:
             st.dataframe(bad_rows['Mapped_Location'].value_counts().reset_index(name='Count'), use_container_width=True)
 
-    if st.button(" Deep Scan (Use Online API)"):
-        st.session_state['deep_scan_active'] = True
+    if loc_key in deep_scanned:
+        st.caption("Deep Scan already run for this column: the cities above were not found online either.")
+    elif st.button(" Deep Scan (Use Online API)"):
+        # Outside the cache: progress is drawn live, and the hits it stores re-key geocode()
         with st.spinner("Connecting to API..."):
-            geo_df = geo_bot.analyze_location_data(df, loc_col, use_api=True, progress_callback=update_progress)
-            st.session_state['geo_processed_df'] = geo_df
-            st.rerun()
+            geo_bot.analyze_location_data(df[[loc_col]], loc_col, use_api=True, progress_callback=update_progress)
+        deep_scanned.add(loc_key)
+        st.rerun()
 
 # --- CONTEXT DETECTION (The Fix for "It doesn't know what it is") ---
 # We look for other metrics in the dataset to color the map meaningfully
@@ -90,11 +121,11 @@ sentiment_col = next((c for c in valid_cols if 'sentiment_score' in c.lower()),
 # Priority 2: Churn Risk (Red/Green Map)
 churn_col = next((c for c in valid_cols if 'churn probability' in c.lower()), None)
 # Priority 3: Money/Spend (Bubble Size Map)
-money_col = next((c for c in valid_cols if any(x in c.lower() for x in ['total', 'amount', 'sales', 'charge'])), None)
+money_col = next((c for c in valid_cols if _MONEY_RE.search(c)), None)
 
 # Default: Just count frequency if nothing else
 if 'Count' not in plot_df.columns:
-    plot_df['Count'] = 1
+    plot_df['Count'] = np.ones(len(plot_df), dtype=np.int8)
 
 # --- VISUALIZATION ---
 tab1, tab2 = st.tabs([" Global Map", " Insights"])
@@ -119,23 +150,21 @@ with tab1:
             title_text = f"Revenue Map (Size = {money_col})"
         else:
             # Fallback: Size by Frequency
-            freq_map = plot_df['Mapped_Location'].value_counts()
-            plot_df['Frequency'] = plot_df['Mapped_Location'].map(freq_map)
             size_col = 'Frequency'
             title_text = "Location Frequency Map"
 
-        # Create Map
-        if plot_df['Mapped_Location'].str.contains(' to |-', regex=True).any():
-            # Route Map
-            fig = px.scatter_geo(plot_df, lat='lat', lon='lon', hover_name='Mapped_Location', 
-                                 size=size_col, color=color_col,
-                                 projection="natural earth", title=title_text)
-        else:
-            # Scatter Map
-            fig = px.scatter_geo(plot_df, lat='lat', lon='lon', hover_name='Mapped_Location',
-                                 size=size_col, color=color_col,
-                                 projection="natural earth", title=title_text)
-            
+        # One marker per location (its rows share coordinates), so the figure payload
+        # scales with distinct locations rather than rows; metrics are location means
+        map_df = plot_df.groupby('Mapped_Location', observed=True, sort=False).agg(
+            lat=('lat', 'first'), lon=('lon', 'first'), Frequency=('Mapped_Location', 'size'),
+            **{c: (c, 'mean') for c in (color_col, size_col) if c in plot_df.columns}
+        ).reset_index()
+
+        # Create Map (routes are already reduced to their origin by the geo engine)
+        fig = px.scatter_geo(map_df, lat='lat', lon='lon', hover_name='Mapped_Location',
+                             size=size_col, color=color_col,
+                             projection="natural earth", title=title_text)
+
         fig.update_layout(height=600, margin={"r":0,"t":40,"l":0,"b":0})
         st.plotly_chart(fig, use_container_width=True)
     else:
@@ -148,13 +177,14 @@ with tab2:
         # Select what to analyze
         # Prefer the detected context columns, else all numbers
         defaults = [c for c in [sentiment_col, churn_col, money_col] if c]
-        num_cols = plot_df.select_dtypes(include=['number']).columns.drop(['lat','lon'], errors='ignore')
+        num_cols = [c for c in column_schema(plot_df)['num'] if c not in ('lat', 'lon')]
         
         with c1:
             target = st.selectbox("Analyze Metric:", num_cols, index=list(num_cols).index(defaults[0]) if defaults and defaults[0] in num_cols else 0)
             
-            # Show Top 10
-            bar_data = plot_df.groupby('Mapped_Location')[target].mean().nlargest(10).reset_index()
+            # Show Top 10 (order comes from nlargest, so skip the groupby sort)
+            loc_means = location_means(plot_df[['Mapped_Location', target]], target)
+            bar_data = loc_means.nlargest(10).reset_index()
             fig_bar = px.bar(bar_data, x='Mapped_Location', y=target, title=f"Top Locations by Avg {target}", color=target)
             st.plotly_chart(fig_bar, use_container_width=True)
             
@@ -162,7 +192,7 @@ with tab2:
             st.subheader(" Location Strategy")
             # --- THE FIX FOR THE CRASH ---
             # We explicitly pass a DataFrame (reset_index) so the engine doesn't crash on Series
-            top_3 = plot_df.groupby('Mapped_Location')[target].mean().nlargest(3).reset_index()
+            top_3 = loc_means.nlargest(3).reset_index()
             
             # Pass context to engine
             context_mode = 'geo'
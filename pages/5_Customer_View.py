@@ -1,22 +1,68 @@
 import streamlit as st
 import pandas as pd
+import re
 import plotly.express as px
 import plotly.graph_objects as go
 import numpy as np
 
 # --- IMPORTS ---
 from components.navigation import sidebar_menu
-from src.churn_engine import ChurnPredictor
-from src.segment_engine import SegmentationEngine
-from src.sentiment_engine import SentimentAnalyzer
+from src.state import init_state, load_file, column_schema, data_fingerprint
+from src.engines import (get_churn_engine, get_seg_engine, get_sentiment_engine,
+                         CHURN_ENGINE_VERSION, SEGMENT_ENGINE_VERSION, SENTIMENT_ENGINE_VERSION)
 from src.config import FILES
 
 st.set_page_config(page_title="Customer Inspector", layout="wide")
+init_state()
 sidebar_menu()
 
 st.title("Customer Inspector")
 st.markdown("Deep dive into specific datasets to analyze individual customer profiles.")
 
+# --- COLUMN NAME PATTERNS ---
+# Compiled once: one case-insensitive scan per column name
+_ID_RE = re.compile(r'id|customer|cust', re.I)
+_SPEND_RE = re.compile(r'monetary|amount|sales|spend|charge', re.I)
+_TEXT_RE = re.compile(r'review|comment|text|body', re.I)
+
+# --- CACHED ID INDEX ---
+# Full-column pass, hashed by content: runs once per dataset/ID column
+@st.cache_data(show_spinner=False, max_entries=16)
+def id_index(df: pd.DataFrame, id_col: str) -> tuple:
+    """ (distinct string IDs in first-seen order, ID -> position of its first row). """
+    ids = df[id_col].astype(str)
+    first = ~ids.duplicated()
+    unique_ids = ids[first].to_numpy(dtype=object)
+    return unique_ids, dict(zip(unique_ids, np.flatnonzero(first)))
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def percentile_ranks(df: pd.DataFrame, radar_cols: tuple) -> pd.DataFrame:
+    """ Per-column percentile ranks over complete rows; independent of the selected customer. """
+    return df[list(radar_cols)].dropna().rank(pct=True)
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def cluster_stats(df: pd.DataFrame, radar_cols: tuple):
+    """ Per-cluster and global means, shared by every customer in the dataset. """
+    cols = list(radar_cols)
+    return df.groupby('Cluster', observed=True)[cols].mean(), df[cols].mean()
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def churn_scores(model_version: int, data_key: str, _bot, _df: pd.DataFrame) -> pd.DataFrame:
+    """ One batched predict for the whole dataset; customer selections index into it. """
+    res = _bot.predict(_df)
+    return res[['Churn Probability', 'Risk Group']] if not res.empty else res
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def auto_segment(data_key: str, k: int, _df: pd.DataFrame) -> dict:
+    """ KMeans fit once per dataset and k, not on every customer selection. """
+    return get_seg_engine(SEGMENT_ENGINE_VERSION).run_segmentation_model(_df, k=k)
+
+@st.cache_data(show_spinner=False, max_entries=1024)
+def review_sentiment(engine_version: int, text) -> tuple:
+    """ (score, label) for one review; reruns and revisits reuse the VADER result. """
+    analysis = get_sentiment_engine(engine_version).analyze_sentiment(pd.DataFrame({'text': [text]}), 'text')
+    return float(analysis['Sentiment_Score'].iloc[0]), str(analysis['Sentiment_Label'].iloc[0])
+
 # --- 1. CONTEXT SELECTION ---
 def get_available_datasets():
     datasets = {}
@@ -24,6 +70,12 @@ def get_available_datasets():
         for key, df in st.session_state['data_cache'].items():
             if not df.empty:
                 datasets[key] = df
+    # Demo files registered by reference are loaded on demand
+    for key, source in st.session_state.get('capability_map', {}).items():
+        if key not in datasets and source in FILES:
+            df = load_file(FILES[source])
+            if not df.empty:
+                datasets[key] = df
     return datasets
 
 available = get_available_datasets()
@@ -46,7 +98,7 @@ with c_sel1:
 
 with c_sel2:
     # 1. Try Auto-detect ID
-    possible_ids = [c for c in df.columns if any(x in c.lower() for x in ['id', 'customer', 'cust'])]
+    possible_ids = [c for c in df.columns if _ID_RE.search(c)]
     
     # 2. Allow Manual Override if missing
     if not possible_ids:
@@ -58,7 +110,7 @@ with c_sel2:
     
     # 3. Customer Selector
     # Limit to first 5000 for performance
-    all_ids = df[id_col].astype(str).unique()
+    all_ids, positions = id_index(df, id_col)
     if len(all_ids) > 5000:
         st.caption(f"Showing first 5,000 of {len(all_ids)} customers.")
         all_ids = all_ids[:5000]
@@ -66,7 +118,7 @@ with c_sel2:
     selected_id = st.selectbox(f"3. Select Customer ({len(all_ids)} available):", all_ids)
 
 # Get the Row
-customer_row = df[df[id_col].astype(str) == str(selected_id)].iloc[0]
+customer_row = df.iloc[positions[str(selected_id)]]
 
 st.markdown("---")
 
@@ -76,12 +128,14 @@ st.markdown("---")
 if selected_context == 'churn':
     st.header(f"Churn Risk Profile: {selected_id}")
     
-    churn_bot = ChurnPredictor()
-    risk_data = churn_bot.predict_single(customer_row.to_dict())
+    churn_bot = get_churn_engine(CHURN_ENGINE_VERSION)
+    data_key = data_fingerprint(df)
+    scores = churn_scores(churn_bot.model_version, data_key, churn_bot, df)
     
-    if risk_data:
-        prob = risk_data['probability']
-        risk_group = risk_data['risk_group']
+    if not scores.empty:
+        scored = scores.iloc[positions[str(selected_id)]]
+        prob = scored['Churn Probability']
+        risk_group = scored['Risk Group']
         
         m1, m2, m3 = st.columns(3)
         m1.metric("Churn Probability", f"{prob:.1%}", delta_color="inverse")
@@ -116,15 +170,16 @@ if selected_context == 'churn':
 elif selected_context == 'segmentation':
     st.header(f"Customer Segment: {selected_id}")
     
-    seg_bot = SegmentationEngine()
+    seg_bot = get_seg_engine(SEGMENT_ENGINE_VERSION)
     
     # 1. AUTO-RUN LOGIC
     if 'Cluster_Label' not in df.columns:
         with st.spinner("Calculating segments..."):
             try:
-                res = seg_bot.run_segmentation_model(df, k=4)
+                res = auto_segment(data_fingerprint(df), 4, df)
                 df = res['data']
-                customer_row = df[df[id_col].astype(str) == str(selected_id)].iloc[0]
+                # New frame: rebuild its ID index before the lookup
+                customer_row = df.iloc[id_index(df, id_col)[1][str(selected_id)]]
             except Exception as e:
                 st.warning(f"Auto-segmentation failed: {e}")
 
@@ -135,7 +190,7 @@ elif selected_context == 'segmentation':
     m1.metric("Segment Name", label)
     
     # Find Spend Column dynamically
-    spend_col = next((c for c in df.columns if any(x in c.lower() for x in ['monetary', 'amount', 'sales', 'spend', 'charge'])), None)
+    spend_col = next((c for c in df.columns if _SPEND_RE.search(c)), None)
     val = customer_row[spend_col] if spend_col else 0
     m2.metric("Monetary Value", f"${val:,.2f}" if isinstance(val, (int, float)) else val)
     m3.metric("Cluster ID", cluster_id)
@@ -145,7 +200,7 @@ elif selected_context == 'segmentation':
     c_radar, c_table = st.columns([1, 1])
     
     # Identify Numeric Columns for comparison (exclude ID)
-    num_cols = df.select_dtypes(include=[np.number]).columns.tolist()
+    num_cols = column_schema(df)['num']
     num_cols = [c for c in num_cols if c != id_col and c != 'Cluster']
     # Pick Top 5 interesting columns (prioritize Recency/Freq/Monetary if exist)
     priority = ['Recency', 'Frequency', 'Monetary', 'Age', 'Spending_Score_Num', 'Tenure', 'MonthlyCharges', 'TotalCharges']
@@ -158,14 +213,12 @@ elif selected_context == 'segmentation':
     if len(radar_cols) >= 3:
         # A. RADAR CHART
         with c_radar:
-            # Normalize data (Percentile Rank)
-            subset = df[radar_cols].dropna()
-            cust_vals = []
-            
-            for col in radar_cols:
-                # Percentile rank of this customer
-                rank = pd.Series(subset[col]).rank(pct=True)[subset.index.get_loc(customer_row.name)] if customer_row.name in subset.index else 0.5
-                cust_vals.append(rank * 100)
+            # Normalize data (Percentile Rank): all columns in one pass, one row lookup
+            ranks = percentile_ranks(df, tuple(radar_cols))
+            if customer_row.name in ranks.index:
+                cust_vals = (ranks.loc[customer_row.name].to_numpy() * 100).tolist()
+            else:
+                cust_vals = [50.0] * len(radar_cols)
             
             fig = go.Figure()
             fig.add_trace(go.Scatterpolar(r=cust_vals, theta=radar_cols, fill='toself', name='This Customer'))
@@ -177,9 +230,12 @@ elif selected_context == 'segmentation':
         with c_table:
             st.write("**Data Comparison**")
             
-            # Calculate Cluster Mean vs Global Mean
-            cluster_mean = df[df['Cluster'] == cluster_id][radar_cols].mean()
-            global_mean = df[radar_cols].mean()
+            # Cluster Mean vs Global Mean (cached; only the row lookup is per-customer)
+            cluster_means, global_mean = cluster_stats(df, tuple(radar_cols))
+            if cluster_id in cluster_means.index:
+                cluster_mean = cluster_means.loc[cluster_id]
+            else:
+                cluster_mean = pd.Series(np.nan, index=radar_cols)
             
             comp_data = []
             for col in radar_cols:
@@ -201,10 +257,8 @@ elif selected_context == 'segmentation':
 elif selected_context == 'sentiment':
     st.header(f"Voice of Customer: {selected_id}")
     
-    sent_bot = SentimentAnalyzer()
-    
     # Manual Text Column Selector if auto-detect fails
-    text_col = next((c for c in df.columns if any(x in c.lower() for x in ['review', 'comment', 'text', 'body'])), None)
+    text_col = next((c for c in df.columns if _TEXT_RE.search(c)), None)
     
     if not text_col:
          text_col = st.selectbox("Select Review Text Column:", [c for c in df.columns if df[c].dtype == 'object'])
@@ -212,12 +266,8 @@ elif selected_context == 'sentiment':
     if text_col:
         raw_text = str(customer_row[text_col])
         
-        # Analyze
-        one_row = pd.DataFrame([customer_row])
-        analysis = sent_bot.analyze_sentiment(one_row, text_col)
-        
-        score = analysis['Sentiment_Score'].iloc[0] if 'Sentiment_Score' in analysis else 0
-        label = analysis['Sentiment_Label'].iloc[0] if 'Sentiment_Label' in analysis else "Neutral"
+        # Analyze (cached on the review text itself)
+        score, label = review_sentiment(SENTIMENT_ENGINE_VERSION, customer_row[text_col])
         
         m1, m2 = st.columns(2)
         m1.metric("Sentiment Label", label, delta="Positive" if label=="Positive" else "-Negative" if label=="Negative" else "Neutral")
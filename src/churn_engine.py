@@ -2,19 +2,38 @@ import pandas as pd
 import xgboost as xgb
 import joblib
 import os
+import threading
+import itertools
 import shap
 import numpy as np
 from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import LabelEncoder
 
+# Rows used to estimate driver direction on large datasets
+IMPORTANCE_SAMPLE = 2000
+
+# Columns _clean_data coerces to numbers (unparseable -> 0)
+NUMERIC_COLS = ('TotalCharges', 'MonthlyCharges', 'Tenure', 'tenure')
+
+# Target values counted as churned (anything else -> 0)
+CHURN_POSITIVE = ('Yes', 'TRUE', 1)
+
+# Process-wide model version source: never reused, unlike id() of a freed model
+_MODEL_VERSIONS = itertools.count(1)
+
 class ChurnPredictor:
     """
     Production-ready pipeline for Churn Prediction.
+    One instance is shared across sessions: train() fits into locals and swaps the
+    model in under a lock, and every scoring method works from one _snapshot().
     """
     
     def __init__(self):
         self.model = None
         self.le_dict = {} 
+        self._fast = None  # (feature -> slot, column -> {class: code}) for predict_single
+        self.model_version = 0  # bumped on every load/train; keys the pages' score caches
+        self._lock = threading.Lock()
         self.model_path = "models/churn_model.pkl"
         self.encoder_path = "models/churn_encoders.pkl"
         
@@ -24,14 +43,31 @@ class ChurnPredictor:
     def _load_model(self):
         if os.path.exists(self.model_path) and os.path.exists(self.encoder_path):
             try:
-                self.model = joblib.load(self.model_path)
-                self.le_dict = joblib.load(self.encoder_path)
+                self._install(joblib.load(self.model_path), joblib.load(self.encoder_path))
             except Exception as e:
                 print(f"⚠️ Could not load model: {e}")
 
+    def _install(self, model, le_dict: dict, save: bool = False):
+        """ Swaps in a fitted model and its encoders together (optionally saving them first). """
+        booster = model.get_booster()
+        fast = ({f: i for i, f in enumerate(booster.feature_names)},
+                {col: {c: i for i, c in enumerate(le.classes_)} for col, le in le_dict.items()})
+        with self._lock:
+            if save:
+                joblib.dump(model, self.model_path)
+                joblib.dump(le_dict, self.encoder_path)
+            self.model, self.le_dict, self._fast = model, le_dict, fast
+            self.model_version = next(_MODEL_VERSIONS)
+
+    def _snapshot(self):
+        """ (model, le_dict, fast) from one install, so a concurrent train() can't mix them. """
+        with self._lock:
+            return self.model, self.le_dict, self._fast
+
     def _clean_data(self, df: pd.DataFrame) -> pd.DataFrame:
-        df_clean = df.copy()
-        for col in ['TotalCharges', 'MonthlyCharges', 'Tenure', 'tenure']:
+        # Shallow copy: only whole columns are replaced below, so the input is never written to
+        df_clean = df.copy(deep=False)
+        for col in NUMERIC_COLS:
             if col in df_clean.columns:
                 df_clean[col] = pd.to_numeric(df_clean[col], errors='coerce').fillna(0)
         return df_clean
@@ -44,75 +80,94 @@ class ChurnPredictor:
             return {"error": "Target column 'Churn' not found."}
         
         X = df_clean.drop(columns=['Churn', 'customerID', 'customer_id', 'id'], errors='ignore')
-        y = df_clean[target_col].map({'Yes': 1, 'No': 0, 'TRUE': 1, 'FALSE': 0, 1: 1, 0: 0}).fillna(0)
+        # Vectorized label encoding: positive labels -> 1, anything else -> 0
+        y = df_clean[target_col].isin(CHURN_POSITIVE).astype('int8')
         
-        X_enc = X.copy()
-        self.le_dict = {} 
+        # drop() already returned a new frame: encode it in place, no second copy
+        le_dict = {} 
         
-        for col in X_enc.select_dtypes(include=['object', 'category']).columns:
+        for col in X.select_dtypes(include=['object', 'category']).columns:
             le = LabelEncoder()
-            X_enc[col] = le.fit_transform(X_enc[col].astype(str))
-            self.le_dict[col] = le
+            # Same 'nan' fill as _encode, so missing values get one consistent class
+            X[col] = le.fit_transform(X[col].astype(str).fillna('nan'))
+            le_dict[col] = le
+        # XGBoost bins float32 internally: hand it that directly instead of int64/float64 columns
+        X = X.astype('float32')
             
-        X_train, X_test, y_train, y_test = train_test_split(X_enc, y, test_size=0.2, random_state=42)
+        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
         
         pos_weight = (y == 0).sum() / (y == 1).sum() if (y == 1).sum() > 0 else 1
         
-        self.model = xgb.XGBClassifier(
+        # Fitted off to the side: other sessions keep scoring with the current model meanwhile
+        model = xgb.XGBClassifier(
             n_estimators=100, max_depth=4, learning_rate=0.05,
             scale_pos_weight=pos_weight, eval_metric='logloss', use_label_encoder=False
         )
-        self.model.fit(X_train, y_train)
+        model.fit(X_train, y_train)
+        accuracy = model.score(X_test, y_test)
         
-        joblib.dump(self.model, self.model_path)
-        joblib.dump(self.le_dict, self.encoder_path)
+        self._install(model, le_dict, save=True)
         
-        return {"accuracy": self.model.score(X_test, y_test)}
+        return {"accuracy": accuracy}
 
     def predict(self, df: pd.DataFrame):
-        if not self.model: return pd.DataFrame()
+        model, le_dict, _ = self._snapshot()
+        if not model: return pd.DataFrame()
         
         df_clean = self._clean_data(df)
         X = df_clean.drop(columns=['Churn', 'customerID', 'customer_id', 'id'], errors='ignore')
         
-        booster = self.model.get_booster()
-        expected_features = booster.feature_names
-        
-        X_aligned = pd.DataFrame(index=X.index)
-        for feat in expected_features:
-            if feat in X.columns:
-                X_aligned[feat] = X[feat]
-            else:
-                X_aligned[feat] = 0 
+        # Model's feature order in one reindex; features missing from the input are 0
+        booster = model.get_booster()
+        X_aligned = X.reindex(columns=booster.feature_names, fill_value=0)
                 
-        for col, le in self.le_dict.items():
-            if col in X_aligned.columns:
-                X_aligned[col] = X_aligned[col].astype(str).map(
-                    lambda x: np.where(le.classes_ == x)[0][0] if x in le.classes_ else -1
-                )
+        self._encode(X_aligned, le_dict)
                 
-        preds = self.model.predict_proba(X_aligned)[:, 1]
+        # Booster directly on a float32 matrix: no sklearn wrapper or 2-column proba stack
+        preds = booster.inplace_predict(X_aligned.to_numpy(dtype=np.float32))
         
-        results = df_clean.copy()
+        results = df_clean.copy(deep=False)
         results['Churn Probability'] = preds
         results['Risk Group'] = pd.cut(preds, bins=[-0.1, 0.4, 0.7, 1.1], labels=['Low', 'Medium', 'High'])
         return results
 
+    def _encode(self, X_aligned: pd.DataFrame, le_dict: dict):
+        """ In-place label encoding; classes_ is sorted, so a binary search finds each code (unseen -> -1). """
+        for col, le in le_dict.items():
+            if col in X_aligned.columns:
+                classes = le.classes_
+                # fillna: pandas 3 keeps missing values as NaN through astype(str)
+                vals = X_aligned[col].astype(str).fillna('nan').to_numpy(dtype=object)
+                pos = np.searchsorted(classes, vals).clip(0, len(classes) - 1)
+                X_aligned[col] = np.where(classes[pos] == vals, pos, -1)
+
     # --- THIS WAS MISSING ---
     def predict_single(self, row_dict: dict):
-        """ Wrapper to predict for a single dictionary row. """
-        if not self.model: return None
-        # Convert dict to DataFrame
-        df_single = pd.DataFrame([row_dict])
-        # Use main predict logic
-        res = self.predict(df_single)
-        
-        if not res.empty:
-            return {
-                'probability': res.iloc[0]['Churn Probability'],
-                'risk_group': res.iloc[0]['Risk Group']
-            }
-        return None
+        """
+        Single-row prediction without the DataFrame pipeline: values are written
+        straight into a float32 feature buffer and scored with inplace_predict.
+        Same cleaning/encoding rules as predict().
+        """
+        model, _, fast = self._snapshot()
+        if not model: return None
+        booster = model.get_booster()
+        feat_idx, class_idx = fast
+        
+        buf = np.zeros((1, len(feat_idx)), dtype=np.float32)
+        for key, val in row_dict.items():
+            i = feat_idx.get(key)
+            if i is None: continue
+            if key in class_idx:
+                buf[0, i] = class_idx[key].get('nan' if pd.isna(val) else str(val), -1)
+            elif key in NUMERIC_COLS:
+                num = pd.to_numeric(val, errors='coerce')
+                buf[0, i] = 0 if pd.isna(num) else num
+            else:
+                buf[0, i] = np.nan if val is None else val
+        
+        prob = float(booster.inplace_predict(buf)[0])
+        risk = 'Low' if prob <= 0.4 else 'Medium' if prob <= 0.7 else 'High'
+        return {'probability': prob, 'risk_group': risk}
 
     def get_average_customer(self, df: pd.DataFrame):
         df_clean = self._clean_data(df)
@@ -132,53 +187,66 @@ class ChurnPredictor:
         # Use the new helper
         return self.predict_single(sim_data.to_dict()) or {}
 
-    def get_directional_importance(self, df: pd.DataFrame):
-        if not self.model: return pd.DataFrame()
-        booster = self.model.get_booster()
+    def get_directional_importance(self, df: pd.DataFrame, sample_size: int = IMPORTANCE_SAMPLE):
+        """ Gain ranking plus risk direction; direction uses a seeded row sample on large data. """
+        model, _, _ = self._snapshot()
+        if not model: return pd.DataFrame()
+        booster = model.get_booster()
         imp_map = booster.get_score(importance_type='gain')
         
         imp_df = pd.DataFrame({'Feature': list(imp_map.keys()), 'Importance': list(imp_map.values())})
         imp_df = imp_df.sort_values('Importance', ascending=False).head(5)
         
+        if len(df) > sample_size:
+            idx = np.random.default_rng(0).choice(len(df), sample_size, replace=False)
+            df = df.iloc[idx]
         df_scored = self.predict(df)
-        directions = []
-        for feat in imp_df['Feature']:
-            if feat in df_scored.columns and pd.api.types.is_numeric_dtype(df_scored[feat]):
-                corr = df_scored[feat].corr(df_scored['Churn Probability'])
-                direction = "Increases Risk 🔴" if corr > 0 else "Decreases Risk 🟢"
-                directions.append(direction)
-            else:
-                directions.append("Key Risk Driver ⚠️")
-        imp_df['Impact'] = directions
+        # Direction = sign of each numeric driver's correlation with risk. Only the sign is
+        # needed, so one centered column-wise product (pairwise NaN-aware, like corr) suffices
+        feats = imp_df['Feature']
+        numeric = [f for f in feats if f in df_scored.columns and pd.api.types.is_numeric_dtype(df_scored[f])]
+        M = df_scored[numeric].to_numpy(dtype=np.float64)
+        y = df_scored['Churn Probability'].to_numpy(dtype=np.float64)[:, None]
+        valid = ~np.isnan(M) & ~np.isnan(y)
+        n = np.maximum(valid.sum(axis=0), 1)
+        Mc = np.where(valid, M - np.where(valid, M, 0).sum(axis=0) / n, 0)
+        yc = np.where(valid, y - np.where(valid, y, 0).sum(axis=0) / n, 0)
+        cov = pd.Series(np.einsum('ij,ij->j', Mc, yc), index=numeric)
+        imp_df['Impact'] = np.where(feats.isin(numeric),
+                                    np.where(feats.map(cov) > 0, "Increases Risk 🔴", "Decreases Risk 🟢"),
+                                    "Key Risk Driver ⚠️")
         return imp_df
         
     def recommend_retention_plan(self, df: pd.DataFrame, target_cols: list = None):
         df_clean = self._clean_data(df)
         recommendations = {}
         cols_to_check = target_cols if target_cols else df_clean.select_dtypes(include=['object']).columns.tolist()
-        for col in cols_to_check:
-            if col in ['customerID', 'Churn', 'Risk Group', 'Churn Probability']: continue
-            if col not in df_clean.columns: continue
-            churn_num = df_clean['Churn'].map({'Yes': 1, 'No': 0, 1: 1, 0: 0}).fillna(0)
-            stats = churn_num.groupby(df_clean[col]).mean().sort_values()
-            if len(stats) > 1:
-                recommendations[col] = {"best_option": stats.index[0], "churn_rate": stats.iloc[0]}
+        cols = [c for c in cols_to_check
+                if c not in ['customerID', 'Churn', 'Risk Group', 'Churn Probability'] and c in df_clean.columns]
+        if not cols: return recommendations
+
+        # Encode the target once; each column is then a hash groupby of an int8 Series
+        churn_num = df_clean['Churn'].isin(CHURN_POSITIVE).astype('int8')
+        for col in cols:
+            rates = churn_num.groupby(df_clean[col], sort=False).mean()
+            if len(rates) > 1:
+                best = rates.idxmin()
+                recommendations[col] = {"best_option": best, "churn_rate": rates[best]}
         return recommendations
 
     def get_shap_data(self, row_df):
-        if not self.model: return None
+        model, le_dict, _ = self._snapshot()
+        if not model: return None
         df_clean = self._clean_data(row_df)
         X = df_clean.drop(columns=['Churn', 'customerID', 'customer_id', 'id'], errors='ignore')
         
-        booster = self.model.get_booster()
-        X_aligned = pd.DataFrame(index=X.index)
-        for feat in booster.feature_names:
-            X_aligned[feat] = X[feat] if feat in X.columns else 0
+        booster = model.get_booster()
+        X_aligned = X.reindex(columns=booster.feature_names, fill_value=0)
         
-        for col, le in self.le_dict.items():
-            if col in X_aligned.columns:
-                X_aligned[col] = X_aligned[col].astype(str).map(lambda x: np.where(le.classes_==x)[0][0] if x in le.classes_ else -1)
+        self._encode(X_aligned, le_dict)
         
-        explainer = shap.TreeExplainer(self.model)
-        shap_values = explainer(X_aligned)
-        return shap_values[0]
\ No newline at end of file
+        # XGBoost's built-in TreeSHAP: no explainer to build, and it runs on the
+        # booster's device (GPUTreeShap when the model is configured for CUDA)
+        contribs = booster.predict(xgb.DMatrix(X_aligned), pred_contribs=True)[0]
+        return shap.Explanation(values=contribs[:-1], base_values=contribs[-1],
+                                data=X_aligned.iloc[0].to_numpy(), feature_names=list(X_aligned.columns))
\ No newline at end of file
@@ -2,8 +2,8 @@ import pandas as pd
 import xgboost as xgb
 import joblib
 import os
+import numpy as np
 from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import LabelEncoder
 
 class CLVPredictor:
     """
@@ -12,17 +12,20 @@ class CLVPredictor:
     """
     def __init__(self):
         self.model = None
-        self.le = LabelEncoder()
+        self.cat_uniques = {}  # column -> sorted train-time categories (code = position)
         self.model_path = "models/clv_model.pkl"
+        self.encoder_path = "models/clv_categories.pkl"
         
         # MLOps: Create folder/Load
         os.makedirs("models", exist_ok=True)
         self._load_model()
         
     def _load_model(self):
-        if os.path.exists(self.model_path):
+        # Encoders are required: a model without them cannot encode categoricals consistently
+        if os.path.exists(self.model_path) and os.path.exists(self.encoder_path):
             try:
                 self.model = joblib.load(self.model_path)
+                self.cat_uniques = joblib.load(self.encoder_path)
             except:
                 pass
 
@@ -38,15 +41,18 @@ class CLVPredictor:
             return {"error": "No monetary column (TotalCharges, Monetary, etc.) found."}
 
         # 2. Clean Data
-        df_clean = df.copy()
+        df_clean = df.copy(deep=False)  # only the target column is replaced
         df_clean[target_col] = pd.to_numeric(df_clean[target_col], errors='coerce').fillna(0)
         
         # 3. Prepare Features
         X = df_clean.drop(columns=['customerID', 'id', 'Churn', 'churn', target_col], errors='ignore')
         
-        # Encode
-        for col in X.select_dtypes(include=['object']).columns:
-            X[col] = self.le.fit_transform(X[col].astype(str))
+        # Encode: sorted factorize per column, i.e. LabelEncoder's codes from one hash pass
+        self.cat_uniques = {}
+        for col in X.select_dtypes(include=['object', 'category']).columns:
+            codes, uniques = pd.factorize(X[col].astype(str).fillna('nan'), sort=True)
+            X[col] = codes
+            self.cat_uniques[col] = np.asarray(uniques, dtype=object)
             
         y = df_clean[target_col]
         
@@ -56,6 +62,7 @@ class CLVPredictor:
         
         # MLOps: Save
         joblib.dump(self.model, self.model_path)
+        joblib.dump(self.cat_uniques, self.encoder_path)
         
         return {"status": "success", "target": target_col}
 
@@ -64,21 +71,18 @@ class CLVPredictor:
         if not self.model: return 0.0
         
         try:
-            # Create DataFrame from series
-            df_single = pd.DataFrame([row_series])
+            # Transpose the series into a one-row frame (no per-record dict inference)
+            df_single = row_series.to_frame().T.infer_objects()
             
             # Align features
-            booster = self.model.get_booster()
-            expected = booster.feature_names
+            X = df_single.reindex(columns=self.model.get_booster().feature_names, fill_value=0)
             
-            X = pd.DataFrame(index=[0])
-            for feat in expected:
-                X[feat] = df_single[feat] if feat in df_single.columns else 0
-            
-            # Encode
-            for col in X.select_dtypes(include=['object']).columns:
-                # Simple hash encoding for safety in single prediction
-                X[col] = self.le.fit_transform(X[col].astype(str))
+            # Encode with the train-time classes (sorted): binary search, unseen -> -1
+            for col, classes in self.cat_uniques.items():
+                if col in X.columns:
+                    vals = X[col].astype(str).fillna('nan').to_numpy(dtype=object)
+                    pos = np.searchsorted(classes, vals).clip(0, len(classes) - 1)
+                    X[col] = np.where(classes[pos] == vals, pos, -1)
                 
             pred = self.model.predict(X)[0]
             return float(pred)
@@ -3,6 +3,9 @@ import os
 # Define the path to your data folder
 DATA_DIR = "data/sample"
 
+# Parsed copies of on-disk datasets (Parquet, rebuilt when the source changes)
+CACHE_DIR = ".cache"
+
 # The 3 explicit files you mentioned
 FILES = {
     "churn": os.path.join(DATA_DIR, "sample_churn.csv"),
@@ -1,6 +1,69 @@
 import pandas as pd
 import os
 import io
+import hashlib
+import importlib.util
+from src.config import CACHE_DIR
+
+# Optional: pyarrow's multithreaded CSV parser (falls back to the C engine)
+HAS_PYARROW = importlib.util.find_spec("pyarrow") is not None
+
+def _read_csv(source) -> pd.DataFrame:
+    if not HAS_PYARROW:
+        return pd.read_csv(source)
+    df = pd.read_csv(source, engine='pyarrow')
+    # Match the C engine's naming for blank header cells
+    return df.rename(columns={c: f"Unnamed: {i}" for i, c in enumerate(df.columns) if c == ''})
+
+def _read_parquet(source) -> pd.DataFrame:
+    # Multithreaded column decode; local files are memory-mapped rather than buffered
+    return pd.read_parquet(source, engine='pyarrow', use_threads=True,
+                           memory_map=isinstance(source, str))
+
+def _parquet_path(file_path: str) -> str:
+    key = hashlib.md5(os.path.abspath(file_path).encode()).hexdigest()
+    return os.path.join(CACHE_DIR, f"{key}.parquet")
+
+def _read_cached(file_path: str):
+    """ Parsed Parquet copy of a CSV/Excel file, or None if missing or stale. """
+    pq = _parquet_path(file_path)
+    try:
+        if os.path.getmtime(pq) >= os.path.getmtime(file_path):
+            return _read_parquet(pq)
+    except Exception:
+        pass
+    return None
+
+def _write_cached(file_path: str, df: pd.DataFrame):
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        # ZSTD: ~30% smaller than the snappy default at the same decode speed
+        df.to_parquet(_parquet_path(file_path), engine='pyarrow', index=False,
+                      compression='zstd', row_group_size=65536)
+    except Exception as e:
+        print(f"Could not cache {file_path}: {e}")
+
+def downcast_numeric(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Shrinks int64/float64 columns to the smallest dtype that holds them.
+    Text columns are left as-is: pages select them by object/string dtype.
+    """
+    for col in df.select_dtypes(include='integer').columns:
+        df[col] = pd.to_numeric(df[col], downcast='integer')
+    for col in df.select_dtypes(include='float').columns:
+        df[col] = pd.to_numeric(df[col], downcast='float')
+    return df
+
+def _parse(source, ext: str):
+    if ext == '.csv':
+        return _read_csv(source)
+    elif ext in ['.xlsx', '.xls']:
+        return pd.read_excel(source, engine='openpyxl')
+    elif ext == '.parquet':
+        return _read_parquet(source)
+    elif ext == '.json':
+        return pd.read_json(source, orient='records')
+    return None
 
 def load_dataset(file_source, mapping: dict = None) -> pd.DataFrame:
     """
@@ -20,18 +83,20 @@ def load_dataset(file_source, mapping: dict = None) -> pd.DataFrame:
         ext = os.path.splitext(filename)[1] if filename else ".csv"
         source = file_source 
 
+    # Text/Excel files on disk are parsed once, then re-read from a Parquet copy
+    use_cache = HAS_PYARROW and isinstance(source, str) and ext in ['.csv', '.xlsx', '.xls']
+
     try:
         # 2. Load based on extension
-        if ext == '.csv':
-            df = pd.read_csv(source)
-        elif ext in ['.xlsx', '.xls']:
-            df = pd.read_excel(source, engine='openpyxl')
-        elif ext == '.parquet':
-            df = pd.read_parquet(source, engine='pyarrow')
-        elif ext == '.json':
-            df = pd.read_json(source, orient='records') 
-        else:
-            return pd.DataFrame()
+        df = _read_cached(source) if use_cache else None
+        if df is None:
+            df = _parse(source, ext)
+            if df is None:
+                return pd.DataFrame()
+            # Compact numeric dtypes (less memory per rerun, groupby and model build)
+            df = downcast_numeric(df)
+            if use_cache:
+                _write_cached(source, df)
 
         # 3. Apply Column Mapping (Smart Rename)
         if mapping:
@@ -44,6 +109,26 @@ def load_dataset(file_source, mapping: dict = None) -> pd.DataFrame:
         print(f"Error loading data: {e}")
         return pd.DataFrame()
 
+def load_header(file_path: str) -> pd.DataFrame:
+    """
+    Header-only read (no rows) for capability detection on disk files.
+    """
+    if not os.path.exists(file_path):
+        return pd.DataFrame()
+    ext = os.path.splitext(file_path)[1].lower()
+
+    try:
+        if ext == '.csv':
+            return pd.read_csv(file_path, nrows=0)
+        elif ext in ['.xlsx', '.xls']:
+            return pd.read_excel(file_path, nrows=0, engine='openpyxl')
+        # Other formats have no cheap header read: fall back to a full load
+        return load_dataset(file_path).iloc[:0]
+
+    except Exception as e:
+        print(f"Error reading header: {e}")
+        return pd.DataFrame()
+
 def normalize_columns(df, mapping):
     rename_dict = {v: k for k, v in mapping.items()}
     return df.rename(columns=rename_dict)
\ No newline at end of file
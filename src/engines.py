@@ -0,0 +1,36 @@
+import streamlit as st
+
+# --- SHARED ENGINES ---
+# One instance per class version for every page and session; the version
+# argument keys the cache, so bumping *_ENGINE_VERSION drops old instances.
+# The versions live here rather than in the engine modules, so pages can read
+# them without importing an engine: each module (xgboost/shap, sklearn, vader,
+# geopy) is only imported by the first call to its factory.
+
+# Bump when the matching engine's interface changes
+CHURN_ENGINE_VERSION = 5
+SEGMENT_ENGINE_VERSION = 2
+SENTIMENT_ENGINE_VERSION = 2
+GEO_ENGINE_VERSION = 2
+
+@st.cache_resource(show_spinner=False)
+def get_churn_engine(version: int):
+    from src.churn_engine import ChurnPredictor
+    return ChurnPredictor()
+
+@st.cache_resource(show_spinner=False)
+def get_seg_engine(version: int):
+    from src.segment_engine import SegmentationEngine
+    return SegmentationEngine()
+
+@st.cache_resource(show_spinner=False)
+def get_sentiment_engine(version: int):
+    # VADER lexicon is loaded once
+    from src.sentiment_engine import SentimentAnalyzer
+    return SentimentAnalyzer()
+
+@st.cache_resource(show_spinner=False)
+def get_geo_engine(version: int):
+    # Lookup tables (and API hits added to them) are shared instead of held per session
+    from src.geo_engine import GeoAnalyzer
+    return GeoAnalyzer()
@@ -1,18 +1,48 @@
 import pandas as pd
+import numpy as np
 import re
-import time
+import os
+import json
 import difflib 
+import threading
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor
 from geopy.geocoders import Nominatim
 from geopy.exc import GeocoderTimedOut
+from geopy.extra.rate_limiter import RateLimiter
+from src.config import CACHE_DIR
+
+# Location cleaning patterns, compiled once per process
+_ROUTE_RE = re.compile(r"^(.*?)(?:\s+to\s+|-|\s+via\s+)", re.IGNORECASE)
+# Noise words, "(...)" groups and ", Region" tails in a single scan
+_NOISE_RE = re.compile(r'(?i)\b(?:airport|intl|international|hub|city|ft|fort)\b|\(.*?\)|,.*')
+
+# Tier 4 (API) hits, kept across runs so a city is only fetched once
+API_CACHE_PATH = os.path.join(CACHE_DIR, "geo_api.json")
+# Concurrent API lookups (request starts are still paced by the rate limiter)
+API_WORKERS = 4
+
+# Optional: RapidFuzz's C++ similarity for Tier 3 (falls back to difflib)
+HAS_RAPIDFUZZ = importlib.util.find_spec("rapidfuzz") is not None
+if HAS_RAPIDFUZZ:
+    from rapidfuzz import process, fuzz
 
 class GeoAnalyzer:
     """
     Hybrid Geo-Engine V6 (Export-Data Optimized)
     Includes massive dictionary update based on '2026-01-05T11-32_export.csv'
+    One instance is shared by every session: iata_db/static_db are read-only after
+    __init__, and API hits live in api_hits, which is swapped (never mutated) under a lock.
     """
     
     def __init__(self):
         self.geolocator = Nominatim(user_agent="customer_hub_v6_export")
+        # Nominatim allows ~1 request/s: one limiter paces every thread (and, shared, every session)
+        self._geocode = RateLimiter(self.geolocator.geocode, min_delay_seconds=1.1, max_retries=0)
+        self._lock = threading.Lock()
+        # city -> coords from Tier 4 (this and earlier runs); exact match only, never a Tier 2/3 key.
+        # Replaced as a whole, readers take a snapshot
+        self.api_hits = self._load_api_cache()
         
         # --- TIER 1: IATA CODES (Massive Expansion) ---
         self.iata_db = {
@@ -72,6 +102,8 @@ class GeoAnalyzer:
             "MAA": "Chennai", "HYD": "Hyderabad", "ISB": "Islamabad", "LHE": "Lahore",
             "KHI": "Karachi", "CMB": "Colombo"
         }
+        # Codes are stored upper case; cleaned names are lower case, so lower them once here
+        self._iata_lower = {code: city.lower() for code, city in self.iata_db.items()}
 
         # --- TIER 2: STATIC DB (Explicit Coordinates) ---
         self.static_db = {
@@ -285,40 +317,50 @@ class GeoAnalyzer:
             "sydney": {"lat": -33.8688, "lon": 151.2093, "iso": "AUS"},
             "melbourne": {"lat": -37.8136, "lon": 144.9631, "iso": "AUS"}
         }
+        
+        # Tier 2 index, built once: static_db is not modified after this point
+        keys = sorted(self.static_db, key=len, reverse=True)  # stable: dict order within a length
+        self._key_rank = {k: i for i, k in enumerate(keys)}
+        self._key_re = re.compile("(?=(" + "|".join(map(re.escape, keys)) + "))")
 
     def analyze_location_data(self, df: pd.DataFrame, location_col: str, use_api=False, progress_callback=None):
         geo_df = df.copy()
         if geo_df[location_col].dropna().empty: return geo_df
 
         # --- STEP 1: CLEANING ---
-        def clean_location(val):
-            val = str(val).strip()
-            # 0. Null check
-            if val.lower() == 'nan' or val == '': return None
-            
-            # 1. Route Parser ("London to Paris")
-            match = re.search(r"^(.*?)(?:\s+to\s+|-|\s+via\s+)", val, re.IGNORECASE)
-            if match: val = match.group(1).strip()
-            
-            # 2. IATA Code Check (Upper case 3 letters)
-            if len(val) == 3 and val.upper() in self.iata_db:
-                return self.iata_db[val.upper()].lower()
-            
-            # 3. Regex Noise Removal
-            val = re.sub(r'(?i)\b(airport|intl|international|hub|city|ft|fort)\b', '', val)
-            val = re.sub(r'\(.*?\)', '', val)
-            val = re.sub(r',.*', '', val) # Remove ", Florida"
-            
-            # 4. Unicode Normalization
-            val = val.replace('İ', 'I').replace('ü', 'u').replace('ã', 'a').replace('é', 'e')
-            
-            return val.strip().lower()
-
-        geo_df['__clean_loc__'] = geo_df[location_col].apply(clean_location)
-        unique_cities = geo_df['__clean_loc__'].dropna().unique()
+        # Vectorized over the distinct raw values, then broadcast back by factorized code
+        # (object dtype keeps Python's regex semantics)
+        codes, raw_values = pd.factorize(geo_df[location_col])
+        loc = pd.Series(raw_values, dtype=object).astype(str).str.strip()
+        # 0. Null check
+        missing = (loc.str.lower().eq('nan') | loc.eq('')).to_numpy()
+        
+        # 1. Route Parser ("London to Paris")
+        origin = loc.str.extract(_ROUTE_RE)[0]
+        loc = origin.str.strip().fillna(loc)
+        
+        # 2. IATA Code Check (Upper case 3 letters): these skip the noise steps below
+        three = loc[loc.str.len() == 3]
+        iata = three.str.upper().map(self._iata_lower).dropna()
+        
+        # 3. Regex Noise Removal
+        loc = loc.str.replace(_NOISE_RE, '', regex=True) # e.g. "Orlando Intl (MCO), Florida"
+        
+        # 4. Unicode Normalization
+        for char, ascii_char in (('İ', 'I'), ('ü', 'u'), ('ã', 'a'), ('é', 'e')):
+            loc = loc.str.replace(char, ascii_char, regex=False)
+        
+        cleaned = loc.str.strip().str.lower().to_numpy(dtype=object)
+        cleaned[iata.index] = iata.to_numpy(dtype=object)
+        cleaned[missing] = None
+        cleaned = np.append(cleaned, None)  # slot for code -1 (missing input)
+        # Codes follow first appearance, so this is the row order of first occurrence
+        unique_cities = pd.Series(cleaned[:-1], dtype=object).dropna().unique()
         total_unique = len(unique_cities)
         
         mapping_dict = {}
+        api_queue = []
+        api_hits = self.api_hits  # snapshot: other sessions may swap in a new dict mid-run
         
         for idx, city in enumerate(unique_cities):
             if not city: continue
@@ -332,45 +374,100 @@ class GeoAnalyzer:
                 continue
                 
             # --- TIER 2: SUBSTRING MATCH ---
-            found_sub = False
-            for db_key in self.static_db:
-                if db_key in city: 
-                    mapping_dict[city] = self.static_db[db_key]
-                    found_sub = True
-                    break
-            if found_sub: continue
+            db_key = self._substring_key(city)
+            if db_key:
+                mapping_dict[city] = self.static_db[db_key]
+                continue
 
             # --- TIER 3: FUZZY MATCH ---
-            close_matches = difflib.get_close_matches(city, self.static_db.keys(), n=1, cutoff=0.75)
-            if close_matches:
-                mapping_dict[city] = self.static_db[close_matches[0]]
+            db_key = self._fuzzy_key(city)
+            if db_key:
+                mapping_dict[city] = self.static_db[db_key]
+                continue
+
+            # --- EARLIER API HIT (exact match only) ---
+            if city in api_hits:
+                mapping_dict[city] = api_hits[city]
                 continue
 
             # --- TIER 4: API (CONDITIONAL) ---
             if use_api:
-                coords = self._get_coords_from_api(city)
-                if coords: mapping_dict[city] = coords
+                api_queue.append(city)
             else:
                 mapping_dict[city] = None
 
-        # Map back results
-        def get_lat(city): return mapping_dict.get(city)['lat'] if mapping_dict.get(city) else None
-        def get_lon(city): return mapping_dict.get(city)['lon'] if mapping_dict.get(city) else None
-        
-        geo_df['lat'] = geo_df['__clean_loc__'].apply(get_lat)
-        geo_df['lon'] = geo_df['__clean_loc__'].apply(get_lon)
-        geo_df['Mapped_Location'] = geo_df['__clean_loc__'].str.title()
+        # Tier 4 lookups overlap their network latency; the limiter keeps the request rate.
+        # Workers only return coordinates: shared state is updated once, after the pool
+        if api_queue:
+            with ThreadPoolExecutor(max_workers=API_WORKERS) as pool:
+                results = pool.map(self._get_coords_from_api, api_queue)
+                for done, (city, coords) in enumerate(zip(api_queue, results), 1):
+                    if progress_callback:
+                        progress_callback(done / len(api_queue), f"Geocoding: {city.title()}...")
+                    if coords: mapping_dict[city] = coords
+            hits = {city: mapping_dict[city] for city in api_queue if city in mapping_dict}
+            if hits: self._add_api_hits(hits)
+
+        # Map back results: coordinate and display-name tables per distinct raw value, gathered by code
+        # (the trailing NaN slot is picked up by code -1, i.e. missing locations)
+        coords = [mapping_dict.get(c) if c else None for c in cleaned]
+        lat_tbl = np.array([d['lat'] if d else np.nan for d in coords], dtype=float)
+        lon_tbl = np.array([d['lon'] if d else np.nan for d in coords], dtype=float)
+        geo_df['lat'] = lat_tbl[codes]
+        geo_df['lon'] = lon_tbl[codes]
+        titles = pd.Series(cleaned, dtype=object).str.title().to_numpy(dtype=object)
+        geo_df['Mapped_Location'] = pd.Series(titles[codes], index=geo_df.index, dtype=object)
         
-        return geo_df.drop(columns=['__clean_loc__'])
+        return geo_df
+
+    def _substring_key(self, city):
+        """
+        Longest static_db key contained in city (ties: dict order), via one regex scan.
+        Alternatives are listed longest first, so the lookahead reports the longest key
+        starting at each position ("palma de mallorca" over "palma", "venice" over "nice").
+        """
+        hits = {m.group(1) for m in self._key_re.finditer(city)}
+        return min(hits, key=self._key_rank.__getitem__) if hits else None
+
+    def _fuzzy_key(self, city):
+        """ Closest static_db key with similarity >= 0.75 (difflib's ratio scale), or None. """
+        if HAS_RAPIDFUZZ:
+            hit = process.extractOne(city, self.static_db.keys(), scorer=fuzz.ratio, score_cutoff=75)
+            return hit[0] if hit else None
+        close_matches = difflib.get_close_matches(city, self.static_db.keys(), n=1, cutoff=0.75)
+        return close_matches[0] if close_matches else None
 
     def _get_coords_from_api(self, city_name):
         try:
-            time.sleep(1.1) 
-            location = self.geolocator.geocode(city_name, timeout=5)
+            location = self._geocode(city_name, timeout=5)
             if location:
-                data = {"lat": location.latitude, "lon": location.longitude, "iso": "UNK"}
-                self.static_db[city_name] = data 
-                return data
+                return {"lat": location.latitude, "lon": location.longitude, "iso": "UNK"}
         except:
             return None
-        return None
\ No newline at end of file
+        return None
+
+    def _load_api_cache(self):
+        try:
+            with open(API_CACHE_PATH, encoding="utf-8") as f:
+                return json.load(f)
+        except Exception:
+            return {}
+
+    def _add_api_hits(self, hits):
+        """ Publish new hits: swap in a merged copy (lock-free readers) and persist them. """
+        with self._lock:
+            self.api_hits = {**self.api_hits, **hits}
+            self._save_api_hits(hits)
+
+    def _save_api_hits(self, hits):
+        """ Merge new hits into the on-disk cache (re-read first: other sessions may have written). """
+        try:
+            cache = self._load_api_cache()
+            cache.update(hits)
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            tmp = f"{API_CACHE_PATH}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(cache, f)
+            os.replace(tmp, API_CACHE_PATH)
+        except Exception as e:
+            print(f"Could not cache geocodes: {e}")
\ No newline at end of file
@@ -8,12 +8,8 @@ from sklearn.metrics import silhouette_score
 class SegmentationEngine:
     """
     Unified Segmentation Engine with Rule Extraction & Smart Labeling.
+    Stateless: one instance is shared across sessions, so fitted models are returned, not stored.
     """
-    def __init__(self):
-        self.model = None
-        self.scaler = None
-        self.mode = "Unknown"
-        self.features = []
 
     def run_segmentation_model(self, df: pd.DataFrame, k: int = 4) -> dict:
         """
@@ -49,15 +45,17 @@ class SegmentationEngine:
             output["mode"] = "RFM"
             output["features"] = ['Recency', 'Frequency', 'Monetary']
             
-            # RFM Aggregation Logic
-            model_df['InvoiceDate'] = pd.to_datetime(model_df['InvoiceDate'])
+            # RFM Aggregation Logic (built-in reductions, no per-group lambda)
+            if not pd.api.types.is_datetime64_any_dtype(model_df['InvoiceDate']):
+                model_df['InvoiceDate'] = pd.to_datetime(model_df['InvoiceDate'])
             snapshot_date = model_df['InvoiceDate'].max() + pd.Timedelta(days=1)
             
-            rfm = model_df.groupby('CustomerID').agg({
-                'InvoiceDate': lambda x: (snapshot_date - x.max()).days,
-                'CustomerID': 'count',
-                'TotalAmount': 'sum'
-            }).rename(columns={'InvoiceDate': 'Recency', 'CustomerID': 'Frequency', 'TotalAmount': 'Monetary'})
+            grouped = model_df.groupby('CustomerID')
+            rfm = pd.DataFrame({
+                'Recency': (snapshot_date - grouped['InvoiceDate'].max()).dt.days,
+                'Frequency': grouped.size(),
+                'Monetary': grouped['TotalAmount'].sum()
+            })
             
             model_df = rfm
             X = model_df[output["features"]]
@@ -73,11 +71,11 @@ class SegmentationEngine:
                 return output # Cannot run
 
         # --- 2. CLUSTERING (The Math) ---
-        self.scaler = StandardScaler()
-        X_scaled = self.scaler.fit_transform(X)
+        scaler = StandardScaler()
+        X_scaled = scaler.fit_transform(X)
         
-        self.model = KMeans(n_clusters=k, random_state=42, n_init=10)
-        model_df['Cluster'] = self.model.fit_predict(X_scaled)
+        kmeans = KMeans(n_clusters=k, random_state=42, n_init=10)
+        model_df['Cluster'] = kmeans.fit_predict(X_scaled)
         
         # --- 3. SMART LABELING (The Meaning) ---
         model_df['Cluster_Label'] = self._generate_smart_labels(model_df, output["mode"], output["features"])
@@ -86,10 +84,8 @@ class SegmentationEngine:
         tree = DecisionTreeClassifier(max_depth=3, random_state=42)
         tree.fit(X, model_df['Cluster']) 
         
-        # Save state
-        self.mode = output["mode"]
-        self.features = output["features"]
-        
+        output["scaler"] = scaler
+        output["kmeans"] = kmeans
         output["dt_model"] = tree
         output["dt_features"] = output["features"]
         output["data"] = model_df
@@ -1,74 +1,91 @@
 import pandas as pd
 import numpy as np
-import re
+import os
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
 from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
 from sklearn.feature_extraction.text import CountVectorizer
 from sklearn.decomposition import LatentDirichletAllocation
 
+# Max reviews used to fit the topic vocabulary/LDA (word rankings are stable under sampling)
+TOPIC_FIT_SAMPLE = 5000
+
+# Corpora with at least this many distinct reviews are scored in parallel batches
+PARALLEL_MIN_TEXTS = 20000
+
+# Fixed label set, stored as a categorical (1 byte per row, fast groupbys)
+SENTIMENT_LABELS = ['Positive', 'Negative', 'Neutral']
+
+_worker_vader = None
+
+def _score_batch(texts: list) -> list:
+    """ Worker: compound VADER scores for one batch (one analyzer per process). """
+    global _worker_vader
+    if _worker_vader is None:
+        _worker_vader = SentimentIntensityAnalyzer()
+    return [_worker_vader.polarity_scores(t)['compound'] for t in texts]
+
 class SentimentAnalyzer:
     """
     NLP Engine for Customer Reviews.
+    Shared across sessions: fitted topic models are returned to the caller, never kept on self.
     """
     
     def __init__(self):
         self.analyzer = SentimentIntensityAnalyzer()
-        self.lda_model = None
-        self.vectorizer = None
         
-    def analyze_sentiment(self, df: pd.DataFrame, text_col: str):
+    def analyze_sentiment(self, df: pd.DataFrame, text_col: str, batch_size: int = 2000, n_jobs: int = None):
         """
         Adds 'Sentiment_Score' and 'Sentiment_Label' to the dataframe.
+        Large corpora are split into batches scored across n_jobs processes (default: all cores).
         """
         if text_col not in df.columns:
             return df
             
-        # Clean text helper
-        def clean_text(text):
-            if pd.isna(text): return ""
-            text = str(text).lower()
-            text = re.sub(r'[^a-z\s]', '', text) # Remove punctuation
-            return text
+        # Handle NaN/Empty (object dtype keeps Python's regex semantics below)
+        raw = df[text_col].astype(object)
+        empty = raw.isna() | raw.astype(str).str.strip().eq("")
+        text = raw[~empty].astype(str).astype(object)
 
-        # Apply VADER
-        scores = []
-        labels = []
-        clean_texts = []
-        
-        for text in df[text_col]:
-            # Handle NaN/Empty
-            if pd.isna(text) or str(text).strip() == "":
-                scores.append(0)
-                labels.append('Neutral')
-                clean_texts.append("")
-                continue
+        # Clean for topic modeling later
+        clean_texts = pd.Series("", index=df.index, dtype=object)
+        clean_texts[~empty] = text.str.lower().str.replace(r'[^a-z\s]', '', regex=True) # Remove punctuation
 
-            # Clean for topic modeling later
-            clean_texts.append(clean_text(text))
-            
-            # Score (VADER handles punctuation well, so we use raw text for scoring)
-            score = self.analyzer.polarity_scores(str(text))['compound']
-            scores.append(score)
-            
-            if score >= 0.05:
-                labels.append('Positive')
-            elif score <= -0.05:
-                labels.append('Negative')
-            else:
-                labels.append('Neutral')
+        # Score (VADER handles punctuation well, so we use raw text for scoring)
+        # VADER is per-string Python: score each distinct review once
+        distinct = text.unique().tolist()
+        n_jobs = n_jobs or os.cpu_count() or 1
+        if n_jobs > 1 and len(distinct) >= PARALLEL_MIN_TEXTS:
+            batches = [distinct[i:i + batch_size] for i in range(0, len(distinct), batch_size)]
+            # spawn: forking Streamlit's threaded server process is unsafe
+            with ProcessPoolExecutor(n_jobs, mp_context=mp.get_context('spawn')) as pool:
+                compound = [s for batch in pool.map(_score_batch, batches) for s in batch]
+        else:
+            compound = [self.analyzer.polarity_scores(t)['compound'] for t in distinct]
+        polarity = dict(zip(distinct, compound))
+        scores = pd.Series(0.0, index=df.index)
+        scores[~empty] = text.map(polarity)
+
+        # Integer codes into SENTIMENT_LABELS; no per-row label strings are built
+        score_arr = scores.to_numpy()
+        codes = np.full(len(score_arr), 2, dtype=np.int8)
+        codes[score_arr <= -0.05] = 1
+        codes[score_arr >= 0.05] = 0
                 
         result_df = df.copy()
-        result_df['Sentiment_Score'] = scores
-        result_df['Sentiment_Label'] = labels
-        result_df['Clean_Text'] = clean_texts
+        result_df['Sentiment_Score'] = scores.to_numpy(dtype=np.float32)
+        result_df['Sentiment_Label'] = pd.Categorical.from_codes(codes, SENTIMENT_LABELS)
+        result_df['Clean_Text'] = clean_texts.values
         
         return result_df
 
     def extract_topics(self, df: pd.DataFrame, text_col='Clean_Text', n_topics=5):
         """
         Runs LDA to find top themes in the text.
+        Returns (topics, topic_model); pass topic_model to get_topic_distribution.
         """
         if text_col not in df.columns:
-            return {}
+            return {}, None
 
         # Vectorize (Turn text into numbers)
         # Drop empty strings to avoid errors
@@ -76,31 +93,37 @@ class SentimentAnalyzer:
         valid_text = valid_text[valid_text.str.len() > 2] # Must be > 2 chars
         
         if valid_text.empty:
-            return {}
+            return {}, None
+
+        # Fit on a seeded sample; get_topic_distribution still labels every row
+        if len(valid_text) > TOPIC_FIT_SAMPLE:
+            valid_text = valid_text.sample(n=TOPIC_FIT_SAMPLE, random_state=42)
 
-        self.vectorizer = CountVectorizer(max_df=0.95, min_df=2, stop_words='english')
-        dtm = self.vectorizer.fit_transform(valid_text)
+        vectorizer = CountVectorizer(max_df=0.95, min_df=2, stop_words='english')
+        dtm = vectorizer.fit_transform(valid_text)
         
         # Train LDA
-        self.lda_model = LatentDirichletAllocation(n_components=n_topics, random_state=42)
-        self.lda_model.fit(dtm)
+        lda_model = LatentDirichletAllocation(n_components=n_topics, random_state=42)
+        lda_model.fit(dtm)
         
         # Extract Keywords for each topic
         topics = {}
-        feature_names = self.vectorizer.get_feature_names_out()
+        feature_names = vectorizer.get_feature_names_out()
         
-        for topic_idx, topic in enumerate(self.lda_model.components_):
+        for topic_idx, topic in enumerate(lda_model.components_):
             # Get top 10 words for this topic
             top_words = [feature_names[i] for i in topic.argsort()[:-11:-1]]
             topics[f"Topic {topic_idx+1}"] = top_words
-            
-        return topics
+        
+        # The fitted texts and their matrix travel along, so assignment can skip re-tokenizing
+        topic_model = {"vectorizer": vectorizer, "lda": lda_model, "fit_texts": valid_text, "fit_dtm": dtm}
+        return topics, topic_model
 
-    def get_topic_distribution(self, df: pd.DataFrame, text_col='Clean_Text'):
+    def get_topic_distribution(self, df: pd.DataFrame, topic_model: dict, text_col='Clean_Text'):
         """
-        Assigns the dominant topic to each review.
+        Assigns the dominant topic to each review, using a model from extract_topics.
         """
-        if not self.lda_model or text_col not in df.columns:
+        if not topic_model or text_col not in df.columns:
             return df
             
         valid_mask = (df[text_col].notna()) & (df[text_col].str.len() > 2)
@@ -109,8 +132,12 @@ class SentimentAnalyzer:
         if valid_text.empty:
             return df
 
-        dtm = self.vectorizer.transform(valid_text)
-        topic_results = self.lda_model.transform(dtm)
+        # Same texts as the fit: reuse its matrix instead of re-tokenizing the corpus
+        if topic_model["fit_texts"].equals(valid_text):
+            dtm = topic_model["fit_dtm"]
+        else:
+            dtm = topic_model["vectorizer"].transform(valid_text)
+        topic_results = topic_model["lda"].transform(dtm)
         
         # Get index of max probability
         dominant_topics = topic_results.argmax(axis=1)
@@ -118,12 +145,11 @@ class SentimentAnalyzer:
         # Align with original index
         df_out = df.copy()
         
-        # Initialize columns
-        df_out['Topic_ID'] = -1
-        df_out['Topic_Label'] = "Unknown"
-        
-        # Assign only to valid rows
-        df_out.loc[valid_mask, 'Topic_ID'] = dominant_topics
-        df_out.loc[valid_mask, 'Topic_Label'] = [f"Topic {t+1}" for t in dominant_topics]
+        # -1 (Unknown) except on valid rows; labels are categorical codes over the topic ids
+        topic_ids = np.full(len(df_out), -1, dtype=np.int8)
+        topic_ids[valid_mask.to_numpy()] = dominant_topics
+        df_out['Topic_ID'] = topic_ids
+        df_out['Topic_Label'] = pd.Categorical.from_codes(
+            topic_ids + 1, ['Unknown'] + [f"Topic {t+1}" for t in range(topic_results.shape[1])])
         
         return df_out
\ No newline at end of file
@@ -0,0 +1,64 @@
+import os
+import hashlib
+import pandas as pd
+import streamlit as st
+from src.data_loader import load_dataset
+
+def init_state():
+    """
+    Shared session-state keys, initialized in one place.
+    setdefault is a single lookup-or-insert, safe to call on every rerun.
+    """
+    st.session_state.setdefault('data_cache', {})
+    st.session_state.setdefault('capability_map', {})
+    st.session_state.setdefault('flags', {'churn': False, 'segmentation': False, 'geo': False, 'sentiment': False})
+
+@st.cache_data(show_spinner=False, max_entries=8, ttl=24 * 60 * 60)
+def _load_file(path: str, mtime: float) -> pd.DataFrame:
+    return load_dataset(path)
+
+def load_file(path: str) -> pd.DataFrame:
+    """
+    Full file load, parsed once per file version.
+    The mtime argument re-keys the cache when the file changes on disk.
+    """
+    return _load_file(path, os.path.getmtime(path))
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def _column_schema(schema_key: tuple, _df: pd.DataFrame) -> dict:
+    return {
+        'num': _df.select_dtypes(include='number').columns.tolist(),
+        'obj': _df.select_dtypes(include='object').columns.tolist(),
+        'text': _df.select_dtypes(include=['object', 'string']).columns.tolist(),
+    }
+
+def column_schema(df: pd.DataFrame) -> dict:
+    """
+    Column names bucketed by dtype ('num', 'obj', 'text').
+    Keyed on (name, dtype) pairs only, so reruns skip select_dtypes until the schema changes.
+    """
+    return _column_schema(tuple(zip(df.columns, df.dtypes.astype(str))), df)
+
+def data_fingerprint(data) -> str:
+    """
+    Content digest of a DataFrame or Series, used to key the per-data caches.
+    blake2b rather than hash(): stable across processes, so disk-persisted caches still hit after a restart.
+    """
+    digest = hashlib.blake2b(pd.util.hash_pandas_object(data).values.tobytes(), digest_size=16)
+    # Column labels too: same values under renamed columns are a different dataset to the pages
+    labels = data.columns if isinstance(data, pd.DataFrame) else [data.name]
+    digest.update(repr(list(labels)).encode())
+    return digest.hexdigest()
+
+@st.cache_data(show_spinner=False, max_entries=8, ttl=3600)
+def _load_upload(name: str, size: int, file_id: str, _file) -> pd.DataFrame:
+    # Parse straight from the resident upload buffer (no getvalue() copy)
+    _file.seek(0)
+    return load_dataset(_file)
+
+def load_upload(uploaded_file) -> pd.DataFrame:
+    """
+    Uploaded file load, parsed once per upload.
+    Shared by the home page and the sidebar, so either path reuses the other's parse.
+    """
+    return _load_upload(uploaded_file.name, uploaded_file.size, uploaded_file.file_id, uploaded_file)